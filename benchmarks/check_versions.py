@@ -0,0 +1,406 @@
+"""Benchmark `fedtools check-versions` against local forge stand-ins
+
+Generates synthetic package trees (`<package>/<package>.spec`, each one a git
+repository) and serves the crates.io, GitHub, GitLab, PyPI and Anitya APIs
+from a local HTTP server with configurable latency, pagination and rate limits.
+No request leaves the machine.
+
+Reports wall time, requests issued and peak RSS for the stages of
+`check_versions`: `gather_package_information`, `collect_git_dirty_states`,
+the upstream lookups (`get_latest_package_version`) and the output
+(`package_record` / `print_table`).
+
+Usage:
+    poetry run python benchmarks/check_versions.py --packages 100 1000 10000
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+
+FORGES = ["crates", "github", "gitlab", "pypi"]
+GITLAB_HOST = "gitlab.example.org"
+SPEC_TEMPLATE = """Name:           {name}
+Version:        1.0.0
+Release:        1%{{?dist}}
+Summary:        Synthetic benchmark package
+License:        MIT
+Source0:        {source}
+
+%description
+Synthetic benchmark package.
+"""
+
+
+def upstream_name(index: int) -> str:
+    return f"bench{index}"
+
+
+def latest_version(name: str) -> str:
+    # Every third package is outdated
+    return "1.1.0" if int(name.removeprefix("bench")) % 3 == 0 else "1.0.0"
+
+
+def source_url(forge: str, name: str) -> str:
+    if forge == "crates":
+        return f"https://crates.io/api/v1/crates/{name}/1.0.0/download#/{name}-1.0.0.crate"
+    elif forge == "github":
+        return f"https://github.com/bench/{name}/archive/v1.0.0/{name}-1.0.0.tar.gz"
+    elif forge == "gitlab":
+        return f"https://{GITLAB_HOST}/bench/{name}/-/archive/v1.0.0/{name}-v1.0.0.tar.gz"
+
+    return f"https://files.pythonhosted.org/packages/source/b/{name}/{name}-1.0.0.tar.gz"
+
+
+def generate_tree(root: str, count: int):
+    """Generate `count` package directories with a spec file and a git repository"""
+    for index in range(count):
+        name = upstream_name(index)
+        forge = FORGES[index % len(FORGES)]
+        package = f"rust-{name}" if forge == "crates" else name
+        path = os.path.join(root, package)
+        os.makedirs(path)
+        with open(os.path.join(path, f"{package}.spec"), "w") as f:
+            f.write(SPEC_TEMPLATE.format(name=package, source=source_url(forge, name)))
+        subprocess.run(["git", "init", "-q", path], check=True)
+        subprocess.run(["git", "-C", path, "add", "."], check=True)
+        subprocess.run(
+            [
+                "git",
+                "-C",
+                path,
+                "-c",
+                "user.name=bench",
+                "-c",
+                "user.email=bench@localhost",
+                "commit",
+                "-q",
+                "-m",
+                "Initial commit",
+            ],
+            check=True,
+        )
+        # Some packages have local changes
+        if index % 10 == 0:
+            with open(os.path.join(path, "sources"), "w") as f:
+                f.write("dirty\n")
+
+
+class ForgeStandIn(ThreadingHTTPServer):
+    """HTTP server that answers like the upstream forge APIs
+
+    Requests are expected as http://<server>/<original host>/<original path>.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float, page_size: int, tags: int, rate_limit: int):
+        super().__init__(("127.0.0.1", 0), ForgeHandler)
+        self.latency = latency
+        self.page_size = page_size
+        self.tags = tags
+        self.rate_limit = rate_limit
+        self.rate_limit_window = 60
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.budgets = {}
+
+    def count(self, host: str) -> tuple[int, int]:
+        """Count a request and return the remaining budget and its reset time"""
+        with self.lock:
+            self.requests[host] = self.requests.get(host, 0) + 1
+            now = time.time()
+            remaining, reset = self.budgets.get(host, (self.rate_limit, 0))
+            if reset <= now:
+                remaining, reset = self.rate_limit, now + self.rate_limit_window
+            remaining -= 1
+            self.budgets[host] = (remaining, reset)
+            return remaining, int(reset)
+
+    def total_requests(self) -> int:
+        with self.lock:
+            return sum(self.requests.values())
+
+
+class ForgeHandler(BaseHTTPRequestHandler):
+    server: ForgeStandIn
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, data, status: int = 200, headers: dict | None = None):
+        body = (data if isinstance(data, str) else json.dumps(data)).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def tag_names(self, name: str) -> list[str]:
+        # The newest tags of every fifth project are svn tags that have to be
+        # skipped with an upstream-version-prefix rule
+        if int(name.removeprefix("bench")) % 5 == 0:
+            svn_tags = [f"svn{index}" for index in range(self.server.tags)]
+        else:
+            svn_tags = []
+        return svn_tags + [f"v{latest_version(name)}", "v1.0.0", "v0.9.0"]
+
+    def graphql_tags(self, query: str) -> dict:
+        """Answer the tag queries of prefetch_github_tags / iter_github_graphql_tag_pages
+
+        Batched queries alias every repository ("r0: repository(...)"), queries
+        for further pages of a single repository are not aliased. The cursor
+        is the offset of the next page.
+        """
+        data = {}
+        for alias, name, first, after in re.findall(
+            r'(?:(r\d+): )?repository\(owner: "[^"]+", name: "([^"]+)"\)'
+            r' \{ refs\(refPrefix: "refs/tags/", first: (\d+)(?:, after: "(\d+)")?',
+            query,
+        ):
+            tags = self.tag_names(name)
+            start = int(after or 0)
+            end = start + int(first)
+            data[alias or "repository"] = {
+                "refs": {
+                    "nodes": [{"name": tag} for tag in tags[start:end]],
+                    "pageInfo": {
+                        "hasNextPage": end < len(tags),
+                        "endCursor": str(end),
+                    },
+                }
+            }
+        return data
+
+    def paginate(self, host: str, path: str, query: dict, items: list, headers: dict):
+        page = int(query.get("page", ["1"])[0])
+        per_page = min(
+            int(query.get("per_page", [self.server.page_size])[0]),
+            self.server.page_size,
+        )
+        if page * per_page < len(items):
+            query = {key: value[0] for key, value in query.items()}
+            query.update({"page": page + 1, "per_page": per_page})
+            next_url = f"https://{host}{path}?" + "&".join(
+                f"{key}={value}" for key, value in query.items()
+            )
+            headers["Link"] = f'<{next_url}>; rel="next"'
+        return items[(page - 1) * per_page : page * per_page]
+
+    def handle_request(self, body: bytes | None = None):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        host, _, path = url.path[1:].partition("/")
+        path = "/" + path
+        query = parse_qs(url.query)
+        remaining, reset = self.server.count(host)
+        headers = {
+            "X-RateLimit-Limit": str(self.server.rate_limit),
+            "X-RateLimit-Remaining": str(max(remaining, 0)),
+            "X-RateLimit-Reset": str(reset),
+        }
+        if remaining < 0:
+            return self.send_json(
+                {"message": "API rate limit exceeded"}, status=403, headers=headers
+            )
+
+        if host == "crates.io" and (match := re.match(r"/api/v1/crates/([^/]+)$", path)):
+            return self.send_json({"crate": {"max_version": latest_version(match[1])}})
+        elif host == "index.crates.io":
+            name = path.rsplit("/", 1)[-1]
+            return self.send_json(
+                "\n".join(
+                    json.dumps({"name": name, "vers": version, "yanked": False})
+                    for version in ("0.9.0", "1.0.0", latest_version(name))
+                )
+            )
+        elif host == "api.github.com" and path == "/graphql":
+            return self.send_json(
+                {"data": self.graphql_tags(json.loads(body)["query"])}, headers=headers
+            )
+        elif host == "api.github.com" and (
+            match := re.match(r"/repos/[^/]+/([^/]+)/tags$", path)
+        ):
+            tags = [{"name": tag} for tag in self.tag_names(match[1])]
+            return self.send_json(
+                self.paginate(host, path, query, tags, headers), headers=headers
+            )
+        elif host == GITLAB_HOST and (
+            match := re.match(r"/api/v4/projects/(\d+)/repository/tags$", path)
+        ):
+            tags = [{"name": tag} for tag in self.tag_names(f"bench{match[1]}")]
+            return self.send_json(
+                self.paginate(host, path, query, tags, headers), headers=headers
+            )
+        elif host == GITLAB_HOST and (match := re.match(r"/api/v4/projects/([^/]+)$", path)):
+            name = unquote(match[1]).rsplit("/", 1)[-1]
+            return self.send_json({"id": int(name.removeprefix("bench"))}, headers=headers)
+        elif host == "pypi.org" and (match := re.match(r"/pypi/([^/]+)/json$", path)):
+            return self.send_json({"info": {"version": latest_version(match[1])}})
+        elif host == "release-monitoring.org":
+            return self.send_json({"items": [], "total_items": 0})
+
+        self.send_json({"message": "Not Found"}, status=404)
+
+    def do_GET(self):
+        self.handle_request()
+
+    def do_POST(self):
+        self.handle_request(self.rfile.read(int(self.headers["Content-Length"])))
+
+
+def reset_peak_rss():
+    """Reset the peak RSS of this process (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mib() -> float:
+    """Peak RSS since the last reset_peak_rss (Linux) or since the process started"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(name: str, server: ForgeStandIn, results: list, func):
+    reset_peak_rss()
+    requests_before = server.total_requests()
+    start = time.perf_counter()
+    value = func()
+    results.append(
+        [
+            name,
+            f"{time.perf_counter() - start:.2f}",
+            server.total_requests() - requests_before,
+            f"{peak_rss_mib():.1f}",
+        ]
+    )
+    return value
+
+
+def run(count: int, args: argparse.Namespace, server: ForgeStandIn):
+    # Imported here, so the cache directory points to the temporary directory
+    from fedtools import check_upstream_versions
+    import requests
+    import tabulate
+
+    class StandInAdapter(requests.adapters.HTTPAdapter):
+        """Sends all requests to the local forge stand-in"""
+
+        def send(self, request, **kwargs):
+            url = urlparse(request.url)
+            request.url = (
+                f"http://127.0.0.1:{server.server_port}/{url.netloc}{url.path}"
+                + (f"?{url.query}" if url.query else "")
+            )
+            return super().send(request, **kwargs)
+
+    config = {
+        "version-prefix": ["v"],
+        "crates-backend": args.crates_backend,
+        "http-cache-ttl": 0,
+        "github-token": "benchmark" if args.graphql else "",
+        "upstream-version-prefix": [
+            {"name": upstream_name(index), "prefix": "!svn"}
+            for index in range(0, count, 5)
+        ],
+    }
+    results = []
+    with tempfile.TemporaryDirectory() as tree:
+        generate_tree(tree, count)
+        packages = measure(
+            "gather_package_information",
+            server,
+            results,
+            lambda: check_upstream_versions.gather_package_information(
+                tree, args.spec_jobs, use_cache=False
+            ),
+        )
+
+        check_upstream_versions.setup_upstream_lookups(config, args.jobs, use_cache=False)
+        adapter = StandInAdapter(pool_connections=args.jobs, pool_maxsize=args.jobs)
+        check_upstream_versions.requests_session.mount("https://", adapter)
+        check_upstream_versions.requests_session.mount("http://", adapter)
+
+        def lookup():
+            check_upstream_versions.prefetch_upstream_versions(packages, config, args.jobs)
+            for _, package, version in check_upstream_versions.lookup_latest_versions(
+                packages, config, args.jobs
+            ):
+                package["latest_version"] = version
+
+        def print_results():
+            records = [
+                check_upstream_versions.package_record(package, config["version-prefix"])
+                for package in packages
+            ]
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                check_upstream_versions.print_table(records)
+
+        measure(
+            "collect_git_dirty_states",
+            server,
+            results,
+            lambda: check_upstream_versions.collect_git_dirty_states(
+                packages, args.spec_jobs
+            ),
+        )
+        measure("get_latest_package_version", server, results, lookup)
+        measure("package_record / print_table", server, results, print_results)
+
+    print(f"\n{count} packages")
+    print(
+        tabulate.tabulate(
+            results,
+            headers=["Stage", "Wall time (s)", "Requests", "Peak RSS (MiB)"],
+            tablefmt="simple_grid",
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--packages", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds per request")
+    parser.add_argument("--page-size", type=int, default=30, help="Tags per page")
+    parser.add_argument("--tags", type=int, default=50, help="svn tags before the first release tag")
+    parser.add_argument("--rate-limit", type=int, default=5000, help="Requests per host and minute")
+    parser.add_argument("--jobs", type=int, default=16)
+    parser.add_argument("--spec-jobs", type=int, default=None)
+    parser.add_argument("--crates-backend", choices=["api", "sparse-index"], default="api")
+    parser.add_argument("--graphql", action="store_true", help="Use batched GitHub GraphQL queries")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cache:
+        os.environ["XDG_CACHE_HOME"] = cache
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+        server = ForgeStandIn(args.latency, args.page_size, args.tags, args.rate_limit)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        for count in args.packages:
+            run(count, args, server)
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
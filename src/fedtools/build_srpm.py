@@ -1,15 +1,24 @@
 import glob
 import os
+import tabulate
 from argparse import Namespace
-from fedtools.utils import exec_cmd, LOGGER
-from fedtools.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from fedtools import rpmlint_report, source_cache
+from fedtools.cache import cache_path
+from fedtools.utils import exec_cmd, Colors, LOGGER
+from fedtools.config import Config, FEDTOOLS_CONFIG_FILE
 
 
-DEFAULT_MOCK_ROOT_DIR = os.path.abspath("./mock-root")
+# Chroots are kept between builds, so they are stored in the cache directory
+DEFAULT_MOCK_ROOT_DIR = cache_path("mock-root")
 DEFAULT_MOCK_RESULT_DIR = os.path.abspath("./mock-result")
+# Default number of packages whose SRPMs are built at the same time
+DEFAULT_JOBS = 4
+# Default number of mock builds (one per chroot) that run at the same time
+DEFAULT_MOCK_JOBS = 2
 
 
-def get_srpm_file_name(path: str) -> str:
+def get_srpm_file_name(path: str) -> str | None:
     srpm_path = ""
     for line in path.split("\n"):
         if line.startswith("Wrote"):
@@ -17,63 +26,372 @@ def get_srpm_file_name(path: str) -> str:
             break
 
     if not os.path.exists(srpm_path):
-        LOGGER.error("Could not parse SRPM file name from rpmbuild output")
-        exit(1)
+        return None
 
     return os.path.basename(srpm_path)
 
 
-def download_source(path: str):
-    exec_cmd(
-        "spectool",
-        ["--get-files", path],
-        error_msg="ERROR: spectool could not download the source file!",
+def download_source(
+    path: str,
+    use_cache: bool = True,
+    jobs: int = source_cache.DEFAULT_DOWNLOAD_JOBS,
+    show_progress: bool = True,
+):
+    # Sources are shared with other packages / builds through the source cache
+    source_cache.fetch_sources(
+        path, os.path.dirname(os.path.abspath(path)), use_cache, jobs, show_progress
     )
 
 
-def build_srpm_with_fedpkg(arch: str) -> str:
-    cmd_arguments = ["srpm"]
+def build_srpm_with_fedpkg(path: str, arch: str) -> tuple[str | None, str | None]:
+    """Build the SRPM of a spec file with fedpkg
+
+    Parameters:
+        path: Path to the spec file, the SRPM is written next to it
+        arch: Architecture that is passed to `fedpkg srpm --arch`
+
+    Returns: File name of the SRPM and None, or None and the reason why
+             the SRPM could not be built
+    """
+    cmd_arguments = ["--path", os.path.dirname(os.path.abspath(path)), "srpm"]
     if arch is not None:
         cmd_arguments.append("--arch")
         cmd_arguments.append(arch)
 
+    # Only the "Wrote: ..." lines are needed from the (long) rpmbuild output
+    wrote_lines = []
     result = exec_cmd(
         "fedpkg",
         cmd_arguments,
-        error_msg="ERROR: rpmbuild could not build the SRPM!",
+        check_result=False,
+        stream=True,
+        output_callback=lambda name, line: (
+            wrote_lines.append(line) if line.startswith("Wrote") else None
+        ),
     )
+    if result.returncode != 0:
+        stderr = result.stderr.decode("utf-8").strip()
+        LOGGER.error(f"rpmbuild could not build the SRPM of {path}!\n{stderr}")
+        return None, "rpmbuild could not build the SRPM: " + stderr.split("\n")[-1]
+
+    if (srpm := get_srpm_file_name("".join(wrote_lines))) is None:
+        return None, "Could not parse SRPM file name from rpmbuild output"
+
+    return srpm, None
+
+
+def find_spec_files(paths: list[str]) -> list[str]:
+    """Expand directories to the spec files they contain
+
+    Parameters:
+        paths: Spec files or package directories
 
-    return get_srpm_file_name(result.stdout.decode("utf-8"))
+    Returns: Paths to the spec files. Directories without a spec file are kept,
+             so they show up as failed in the summary.
+    """
+    spec_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            spec_files.extend(sorted(glob.glob(os.path.join(path, "*.spec"))) or [path])
+        else:
+            spec_files.append(path)
+
+    return spec_files
+
+
+def build_package(
+    path: str, args: Namespace, config: dict, show_progress: bool
+) -> dict:
+    """Download the sources of a spec file and build its SRPM
+
+    Parameters:
+        path: Path to the spec file
+        args: Arguments of the build-srpm command
+        config: Configuration of the build-srpm command
+        show_progress: Whether to show the download progress
+
+    Returns: Dictionary with the spec file, the path to the SRPM and the error,
+             if the SRPM could not be built
+    """
+    if not os.path.isfile(path):
+        return {"spec": path, "srpm": None, "error": "No spec file found"}
+
+    try:
+        download_source(
+            path,
+            use_cache=not args.no_cache,
+            jobs=config.get("download-jobs", source_cache.DEFAULT_DOWNLOAD_JOBS),
+            show_progress=show_progress,
+        )
+    except source_cache.SourceError as e:
+        return {"spec": path, "srpm": None, "error": str(e)}
 
+    srpm, error = build_srpm_with_fedpkg(path, args.arch)
+    if srpm is not None:
+        srpm = os.path.join(os.path.dirname(path), srpm)
+        LOGGER.info(f"Built {srpm}")
 
-def build_binary_rpm_with_mock(srpm_path: str, mock_arguments: list[str]):
+    return {"spec": path, "srpm": srpm, "error": error}
+
+
+def print_summary(results: list[dict]):
+    """Print the SRPMs that were built and the reasons why the others failed"""
+    rows = []
+    for result in results:
+        if result["srpm"] is not None:
+            rows.append(
+                [
+                    Colors.GREEN + result["spec"] + Colors.RESET,
+                    Colors.GREEN + result["srpm"] + Colors.RESET,
+                ]
+            )
+        else:
+            rows.append(
+                [
+                    Colors.RED + result["spec"] + Colors.RESET,
+                    Colors.RED + result["error"] + Colors.RESET,
+                ]
+            )
+
+    print(
+        tabulate.tabulate(
+            rows,
+            headers=["Spec file", "SRPM"],
+            tablefmt="simple_grid",
+        )
+    )
+
+
+def build_binary_rpm_with_mock(
+    srpm_path: str,
+    mock_arguments: list[str],
+    result_dir: str,
+    tail_command: bool = True,
+) -> bool:
+    """Build the binary RPMs of a SRPM with mock
+
+    Parameters:
+        srpm_path: Path to the SRPM
+        mock_arguments: Arguments that are passed to mock
+        result_dir: Result directory of the build, as passed to mock
+        tail_command: Whether to print the mock output to the command line.
+                      Otherwise only the build logs in `result_dir` are kept.
+
+    Returns: Whether mock could build the package
+    """
     mock_arguments.append(srpm_path)
-    exec_cmd("mock", mock_arguments, tail_command=True)
+    if tail_command is True:
+        result = exec_cmd("mock", mock_arguments, tail_command=True)
+    else:
+        result = exec_cmd("mock", mock_arguments, check_result=False, stream=True)
+    if result.returncode != 0:
+        LOGGER.error(f"mock could not build {srpm_path}, see the logs in {result_dir}")
+        if tail_command is False:
+            LOGGER.error(result.stderr.decode("utf-8", errors="replace"))
+        return False
+
+    return True
+
+
+def pop_argument(arguments: list[str], name: str) -> str | None:
+    """Remove an option and its value from the configured mock arguments
+
+    Both "--option value" and "--option=value" are supported. If the option
+    is given multiple times, the last value wins like it does for mock.
+
+    Parameters:
+        arguments: mock-arguments from the config file, modified in place
+        name: Name of the option, e.g. "--rootdir"
 
-    LOGGER.info("Running rpmlint")
-    # Run RPM lint on the built RPMs
-    for path in glob.glob(f"{DEFAULT_MOCK_RESULT_DIR}/*.rpm"):
-        if "src.rpm" in path:
-            continue
+    Returns: Value of the option or None if it is not part of the arguments
+    """
+    value = None
+    index = 0
+    while index < len(arguments):
+        if arguments[index] == name:
+            if index + 1 == len(arguments):
+                LOGGER.error(
+                    f"{name} in the mock-arguments of {FEDTOOLS_CONFIG_FILE} "
+                    "requires a value"
+                )
+                exit(1)
+            value = arguments[index + 1]
+            del arguments[index : index + 2]
+        elif arguments[index].startswith(f"{name}="):
+            value = arguments.pop(index).removeprefix(f"{name}=")
+        else:
+            index += 1
 
-        LOGGER.info(path)
-        exec_cmd("rpmlint", [path], tail_command=True)
+    return value
+
+
+def build_in_chroot(
+    chroot: str | None,
+    srpms: list[str],
+    mock_arguments: list[str],
+    root_dir: str,
+    result_dir: str,
+    tail_command: bool,
+) -> list[dict]:
+    """Build SRPMs one after another in a chroot
+
+    The chroot is neither cleaned before nor after the builds, so all
+    packages (and later runs) reuse the already installed chroot.
+    A chroot can only be used by one mock process at a time.
+
+    Parameters:
+        chroot: Mock config (e.g. fedora-rawhide-aarch64) or None for the default config
+        srpms: Paths to the SRPMs
+        mock_arguments: Additional arguments that are passed to mock
+        root_dir: Base directory of the chroots
+        result_dir: Base directory of the build results
+        tail_command: Whether to print the mock output to the command line
+
+    Returns: Chroot, SRPM, result directory and status of every build
+    """
+    name = chroot or "default"
+    arguments = ["-r", chroot] if chroot is not None else []
+    arguments.extend(mock_arguments)
+    arguments.extend(
+        [
+            "--rootdir",
+            os.path.join(root_dir, name),
+            "--no-clean",
+            "--no-cleanup-after",
+        ]
+    )
+
+    results = []
+    for srpm in srpms:
+        srpm_result_dir = os.path.join(
+            result_dir, name, os.path.basename(srpm).removesuffix(".src.rpm")
+        )
+        LOGGER.info(f"Building {srpm} in {name}")
+        success = build_binary_rpm_with_mock(
+            srpm,
+            arguments + ["--resultdir", srpm_result_dir],
+            srpm_result_dir,
+            tail_command,
+        )
+        results.append(
+            {
+                "chroot": name,
+                "srpm": srpm,
+                "result_dir": srpm_result_dir,
+                "success": success,
+            }
+        )
+
+    return results
+
+
+def build_with_mock(
+    srpms: list[str], chroots: list[str | None], config: dict, jobs: int
+) -> bool:
+    """Build SRPMs in multiple chroots at the same time
+
+    Parameters:
+        srpms: Paths to the SRPMs
+        chroots: Mock configs that should be used, None stands for the default config
+        config: Configuration of the build-srpm command
+        jobs: Maximum number of mock processes that run at the same time
+
+    Returns: Whether all builds were successful
+    """
+    mock_arguments = list(config.get("mock-arguments", []))
+    # Configured directories are used as the base directories of all chroots
+    root_dir = pop_argument(mock_arguments, "--rootdir") or DEFAULT_MOCK_ROOT_DIR
+    result_dir = (
+        pop_argument(mock_arguments, "--resultdir") or DEFAULT_MOCK_RESULT_DIR
+    )
+    # The output of multiple mock processes would be mixed up
+    tail_command = len(chroots) == 1 or jobs == 1
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        results = [
+            result
+            for chroot_results in executor.map(
+                lambda chroot: build_in_chroot(
+                    chroot, srpms, mock_arguments, root_dir, result_dir, tail_command
+                ),
+                chroots,
+            )
+            for result in chroot_results
+        ]
+
+    if len(results) > 1:
+        print(
+            tabulate.tabulate(
+                [
+                    [
+                        (Colors.GREEN if result["success"] else Colors.RED)
+                        + value
+                        + Colors.RESET
+                        for value in (
+                            result["chroot"],
+                            os.path.basename(result["srpm"]),
+                            result["result_dir"],
+                        )
+                    ]
+                    for result in results
+                ],
+                headers=["Chroot", "SRPM", "Results"],
+                tablefmt="simple_grid",
+            )
+        )
+
+    # rpmlint runs once over the RPMs of all builds
+    rpms = [
+        path
+        for result in results
+        if result["success"]
+        for path in glob.glob(os.path.join(result["result_dir"], "*.rpm"))
+        if not path.endswith(".src.rpm")
+    ]
+    if rpms:
+        LOGGER.info("Running rpmlint")
+        findings = rpmlint_report.lint(rpms)
+        rpmlint_report.print_report(findings)
+        rpmlint_report.write_report(os.path.join(result_dir, "rpmlint.json"), findings)
+        LOGGER.info(f"rpmlint report: {os.path.join(result_dir, 'rpmlint.json')}")
+
+    return all(result["success"] for result in results)
 
 
 def build(args: Namespace):
-    download_source(args.specfile)
-    srpm_path = build_srpm_with_fedpkg(args.arch)
-
-    if args.mock is True:
-        config = Config().command_config(args.command)
-        mock_arguments = config.get("mock-arguments", [])
-        if "--resultdir" not in mock_arguments:
-            mock_arguments.append("--resultdir")
-            mock_arguments.append(DEFAULT_MOCK_RESULT_DIR)
-        if "--rootdir" not in mock_arguments:
-            mock_arguments.append("--rootdir")
-            mock_arguments.append(DEFAULT_MOCK_ROOT_DIR)
-        build_binary_rpm_with_mock(
-            srpm_path,
-            mock_arguments,
+    # The configuration is optional unless mock is used
+    config = {}
+    if args.mock is True or os.path.exists(FEDTOOLS_CONFIG_FILE):
+        config = Config().command_config(args.command) or {}
+
+    spec_files = find_spec_files(args.specfiles)
+    # Progress lines of multiple packages would overwrite each other
+    show_progress = len(spec_files) == 1
+    # Packages are independent of each other, a failed package does not stop the others
+    with ThreadPoolExecutor(max_workers=args.jobs or DEFAULT_JOBS) as executor:
+        results = list(
+            executor.map(
+                lambda path: build_package(path, args, config, show_progress),
+                spec_files,
+            )
         )
+    source_cache.evict(
+        config.get("source-cache-size", source_cache.DEFAULT_SOURCE_CACHE_SIZE)
+    )
+
+    if len(results) > 1:
+        print_summary(results)
+    elif results[0]["srpm"] is None:
+        LOGGER.error(results[0]["error"])
+
+    mock_successful = True
+    if args.mock is True and (
+        srpms := [result["srpm"] for result in results if result["srpm"] is not None]
+    ):
+        chroots = args.chroot or [config.get("mock-root")]
+        mock_successful = build_with_mock(
+            srpms, chroots, config, args.mock_jobs or DEFAULT_MOCK_JOBS
+        )
+
+    if not mock_successful or any(result["srpm"] is None for result in results):
+        exit(1)
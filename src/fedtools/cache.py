@@ -0,0 +1,233 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections.abc import Iterator
+from pathlib import Path
+import requests
+from fedtools.utils import LOGGER
+
+
+FEDTOOLS_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(Path.home(), ".cache")),
+    "fedtools",
+)
+
+
+def cache_path(*name: str) -> str:
+    """Return the path of a file or directory in the fedtools cache directory
+
+    Parameters:
+        name: Path components relative to the cache directory
+
+    Returns: Absolute path to the cache file or directory
+    """
+    return os.path.join(FEDTOOLS_CACHE_DIR, *name)
+
+
+def load_json_cache(name: str) -> dict:
+    """Load a JSON cache file
+
+    Parameters:
+        name: File name of the cache relative to the cache directory
+
+    Returns: The cached data or an empty dict if the cache does not exist or is invalid
+    """
+    try:
+        with open(cache_path(name), "r") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        LOGGER.warning(f"Ignoring invalid cache file {cache_path(name)}")
+        return {}
+
+    return data if isinstance(data, dict) else {}
+
+
+def write_json_cache(name: str, data: dict):
+    """Atomically write a JSON cache file
+
+    Parameters:
+        name: File name of the cache relative to the cache directory
+        data: Data that should be cached
+    """
+    write_file_atomically(cache_path(name), json.dumps(data).encode("utf-8"))
+
+
+def write_file_atomically(path: str, content: bytes):
+    """Write `content` to `path` without leaving a partially written file behind
+
+    Parameters:
+        path: Destination path, parent directories are created if needed
+        content: Content of the file
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        LOGGER.warning(f"Could not write cache file {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextlib.contextmanager
+def file_lock(path: str) -> Iterator[bool]:
+    """Hold an exclusive lock on `path` for the duration of the with block
+
+    The lock is shared by all threads and fedtools processes. The lock file
+    itself is never removed, so it can't be replaced while somebody waits for it.
+
+    Parameters:
+        path: Path of the lock file, parent directories are created if needed
+
+    Returns: Whether the lock was held by somebody else and had to be waited for
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            waited = False
+        except BlockingIOError:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            waited = True
+        try:
+            yield waited
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class HttpCache:
+    """On-disk cache for HTTP GET responses
+
+    Responses are stored together with their ETag / Last-Modified headers.
+    Fresh entries (younger than `ttl`) are returned without sending a request,
+    stale entries are revalidated with a conditional request.
+    """
+
+    def __init__(self, ttl: int, use_cache: bool = True):
+        """
+        Parameters:
+            ttl: Number of seconds a cached response is used without revalidation
+            use_cache: Whether cached responses should be used. New responses
+                       are stored in both cases.
+        """
+        self.ttl = ttl
+        self.use_cache = use_cache
+        self.directory = cache_path("http")
+
+    def __paths(self, url: str) -> tuple[str, str]:
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return (
+            os.path.join(self.directory, key[:2], f"{key}.json"),
+            os.path.join(self.directory, key[:2], f"{key}.body"),
+        )
+
+    def load(self, url: str) -> dict | None:
+        """Return the cached entry for `url` or None if nothing is cached"""
+        if not self.use_cache:
+            return None
+
+        meta_path, body_path = self.__paths(url)
+        try:
+            with open(meta_path, "r") as f:
+                entry = json.load(f)
+            with open(body_path, "rb") as f:
+                entry["content"] = f.read()
+        except (OSError, ValueError):
+            return None
+
+        return entry if entry.get("url") == url else None
+
+    def is_fresh(self, entry: dict) -> bool:
+        """Whether a cached entry can be used without revalidation"""
+        return time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    def conditional_headers(self, entry: dict) -> dict:
+        """Return the headers that are needed to revalidate a cached entry"""
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+        return headers
+
+    def store(self, url: str, response: requests.Response):
+        """Cache a successful response"""
+        meta_path, body_path = self.__paths(url)
+        write_file_atomically(body_path, response.content)
+        write_file_atomically(
+            meta_path,
+            json.dumps(
+                {
+                    "url": url,
+                    "fetched_at": time.time(),
+                    "etag": response.headers.get("ETag"),
+                    "last_modified": response.headers.get("Last-Modified"),
+                    "headers": dict(response.headers),
+                }
+            ).encode("utf-8"),
+        )
+
+    def refresh(self, url: str, entry: dict, response: requests.Response):
+        """Mark a cached entry as fresh after the server answered with 304"""
+        meta_path, _ = self.__paths(url)
+        # The server may send updated validators with the 304 response
+        for key, header in (("etag", "ETag"), ("last_modified", "Last-Modified")):
+            if header in response.headers:
+                entry[key] = response.headers[header]
+        entry["fetched_at"] = time.time()
+        write_file_atomically(
+            meta_path,
+            json.dumps(
+                {key: value for key, value in entry.items() if key != "content"}
+            ).encode("utf-8"),
+        )
+
+    def evict(self, max_age: int):
+        """Remove entries that were not fetched or revalidated for `max_age` seconds
+
+        Fresh entries (younger than `ttl`) are always kept.
+
+        Parameters:
+            max_age: Maximum age of an entry in seconds
+        """
+        max_age = max(max_age, self.ttl)
+        now = time.time()
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                key, extension = os.path.splitext(name)
+                if extension not in (".json", ".body"):
+                    continue
+                path = os.path.join(root, name)
+                # Revalidation only updates the metadata, so it decides the age
+                # of the body as well
+                meta_path = os.path.join(root, f"{key}.json")
+                try:
+                    stat = os.stat(meta_path if os.path.exists(meta_path) else path)
+                    if now - stat.st_mtime > max_age:
+                        os.remove(path)
+                except OSError:
+                    continue
+
+    def response(self, entry: dict) -> requests.Response:
+        """Build a response object from a cached entry"""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry["url"]
+        response.headers = requests.structures.CaseInsensitiveDict(
+            entry.get("headers", {})
+        )
+        response.encoding = requests.utils.get_encoding_from_headers(
+            response.headers
+        )
+        response._content = entry["content"]
+
+        return response
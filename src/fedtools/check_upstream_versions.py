@@ -1,11 +1,27 @@
+import functools
 import glob
+import hashlib
+import json
 import os
-from urllib.parse import urlparse
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from urllib.parse import quote, urlparse
 import requests
 import re
 import tabulate
 from argparse import Namespace
+from collections.abc import Iterable, Iterator
+from email.utils import parsedate_to_datetime
+from urllib3.util import Retry
+from fedtools.cache import (
+    HttpCache,
+    load_json_cache,
+    write_file_atomically,
+    write_json_cache,
+)
 from fedtools.config import Config
+from fedtools import profiling
 from fedtools.utils import (
     exec_cmd,
     Colors,
@@ -14,6 +30,7 @@ from fedtools.utils import (
     LOGGER
 )
 import git
+import rpm
 
 
 # Expressions inspired by
@@ -21,6 +38,15 @@ import git
 NAME_TAG = re.compile(r"^Name\s*:\s*(\S+)", re.IGNORECASE)
 SOURCE_TAG = re.compile(r"^Source0?\s*:\s*(.+)", re.IGNORECASE)
 VERSION_TAG = re.compile(r"^Version\s*:\s*(\S+)", re.IGNORECASE)
+# Segments of a version: numbers, letters and "~"
+VERSION_SEGMENT = re.compile(r"\d+|[a-zA-Z]+|~")
+# Version segments that mark a pre-release
+PRE_RELEASE_MARKERS = {"alpha", "beta", "dev", "pre", "rc"}
+# Short pre-release markers, only if a number follows ("1.0a1"), otherwise
+# they are a regular suffix that is newer than the release ("OpenSSL_1_1_1a")
+SHORT_PRE_RELEASE_MARKERS = {"a", "b"}
+# Number of parsed tags that are kept, bounds the memory of watch-versions
+VERSION_KEY_CACHE_SIZE = 65536
 # RUST_NAME_TAG and IS_RUST_PACKAGE are not needed anymore
 # but are kept for completeness
 # RUST_NAME_TAG = re.compile(r"^%global\s+crate\s+(\S+)")
@@ -28,24 +54,479 @@ VERSION_TAG = re.compile(r"^Version\s*:\s*(\S+)", re.IGNORECASE)
 # According to https://docs.fedoraproject.org/en-US/packaging-guidelines/Rust/
 # all rust packages MUST have rust-packaging as a build dependency
 # IS_RUST_PACKAGE = re.compile(r"BuildRequires\s*:\s*rust-packaging.*")
+# Flag of real sources (in contrast to patches) in rpm.spec.sources
+RPMBUILD_ISSOURCE = getattr(rpm, "RPMBUILD_ISSOURCE", 1)
+# Cache of the information that was extracted from the spec files
+SPEC_CACHE_FILE = "specs.json"
+# Latest results of `fedtools watch-versions`
+SNAPSHOT_FILE = "check-versions-snapshot.json"
+# Cache of the resolved GitLab project IDs
+GITLAB_PROJECTS_CACHE_FILE = "gitlab-projects.json"
+# Files that define the rpm macros, changes to them invalidate the spec cache
+RPM_MACRO_FILES = [
+    "/usr/lib/rpm/macros",
+    "/usr/lib/rpm/macros.d/*",
+    "/usr/lib/rpm/platform/*/macros",
+    "/usr/lib/rpm/redhat/macros",
+    "/etc/rpm/*",
+    "~/.rpmmacros",
+]
+# Status of a package after its latest upstream version was looked up
+STATUS_UP_TO_DATE = "up-to-date"
+STATUS_OUTDATED = "outdated"
+STATUS_UNKNOWN = "unknown"
+# Order of the statuses in the printed table
+STATUS_ORDER = [STATUS_UP_TO_DATE, STATUS_OUTDATED, STATUS_UNKNOWN]
+STATUS_COLORS = {
+    STATUS_UP_TO_DATE: Colors.GREEN,
+    STATUS_OUTDATED: Colors.YELLOW,
+    STATUS_UNKNOWN: Colors.RED,
+}
+# Number of packages that are looked up at the same time
+DEFAULT_JOBS = 16
+# Number of requests that may be sent to a single host at the same time
+# This can be overwritten per host with the "host-jobs" configuration option
+DEFAULT_HOST_JOBS = 4
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36"
+GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
+CRATES_SPARSE_INDEX_URL = "https://index.crates.io"
+ANITYA_PACKAGES_URL = "https://release-monitoring.org/api/v2/packages/"
+# Maximum number of packages Anitya returns per page
+ANITYA_ITEMS_PER_PAGE = 250
+# Number of repositories that are queried in a single GraphQL request
+GITHUB_GRAPHQL_BATCH_SIZE = 50
+# Number of tags that are fetched per repository in a GraphQL request
+GITHUB_GRAPHQL_TAGS = 100
+# Maximum number of tag pages (100 tags each) that are fetched per project.
+# The forges don't sort tags by version, so the newest version is
+# selected from all of these pages.
+DEFAULT_MAX_TAG_PAGES = 5
+# Number of seconds a cached HTTP response is used without asking the server
+DEFAULT_HTTP_CACHE_TTL = 3600
+# Number of seconds after which cached HTTP responses that were not used
+# anymore are removed
+DEFAULT_HTTP_CACHE_MAX_AGE = 7 * 24 * 3600
+# Requests are spread over the time until the rate limit resets once
+# less than this fraction of the budget is left
+RATE_LIMIT_PACING_THRESHOLD = 0.1
+# Requests that would have to wait longer than this (in seconds) for their
+# slot are deferred instead
+RATE_LIMIT_MAX_PACING_DELAY = 10
+# Seconds to wait after a rate limit response without any reset information
+RATE_LIMIT_DEFAULT_BACKOFF = 60
+# Maximum number of seconds to wait for a rate limit reset before deferred
+# packages are given up on
+DEFAULT_RATE_LIMIT_MAX_WAIT = 300
 # Re-uses tcp sessions, should make program faster
 requests_session = requests.Session()
-adapter = requests.adapters.HTTPAdapter(max_retries=10)
-requests_session.mount("https://", adapter)
-requests_session.mount("http://", adapter)
+# Cache for the upstream API responses, this is set up in check_versions
+http_cache: HttpCache | None = None
+# Tags of GitHub projects that were fetched in bulk and the GraphQL cursor
+# of their next page, see prefetch_github_tags
+github_tags: dict[tuple[str, str], tuple[list[str], str | None]] = {}
+# Latest versions that were fetched in bulk from Anitya, see prefetch_anitya_versions
+anitya_versions: dict[str, tuple[str, str]] = {}
+# Maps "<host>/<project path>" to the ID of GitLab projects
+gitlab_project_ids: dict[str, int] = {}
+gitlab_project_ids_lock = threading.Lock()
+# Handles of the package git repositories, see git_repository
+git_repositories: dict[str, git.Repo] = {}
+git_repositories_lock = threading.Lock()
+# Limits the number of concurrent requests per host
+host_semaphores: dict[str, threading.BoundedSemaphore] = {}
+host_semaphores_lock = threading.Lock()
+host_jobs: dict[str, int] = {}
+
+
+def setup_http_session(jobs: int, host_limits: dict[str, int]):
+    """Configure the HTTP session for concurrent upstream lookups
+
+    Parameters:
+        jobs: Maximum number of requests that will be sent at the same time
+        host_limits: Maximum number of concurrent requests for specific hosts
+    """
+    # Every worker thread should be able to keep its own connection open.
+    # Rate limit responses (403 / 429) are not retried here,
+    # they are handled by the RateLimitScheduler.
+    adapter = requests.adapters.HTTPAdapter(
+        max_retries=Retry(
+            total=5,
+            backoff_factor=1,
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False,
+        ),
+        pool_connections=jobs,
+        pool_maxsize=jobs,
+    )
+    requests_session.mount("https://", adapter)
+    requests_session.mount("http://", adapter)
+    with host_semaphores_lock:
+        host_semaphores.clear()
+        host_jobs.clear()
+        host_jobs.update(host_limits)
+
+
+def host_semaphore(host: str) -> threading.BoundedSemaphore:
+    """Return the semaphore that limits the concurrent requests to `host`"""
+    with host_semaphores_lock:
+        if host not in host_semaphores:
+            host_semaphores[host] = threading.BoundedSemaphore(
+                host_jobs.get(host, DEFAULT_HOST_JOBS)
+            )
+        return host_semaphores[host]
+
+
+class RateLimitExceeded(Exception):
+    """Raised when requests to a host have to wait for its rate limit to reset"""
+
+    def __init__(self, host: str, reset: float):
+        super().__init__(f"Rate limit of {host} exceeded")
+        self.host = host
+        self.reset = reset
+
+
+class RateLimitScheduler:
+    """Schedules requests according to the rate limits announced by the hosts
+
+    The budget of a host is read from the X-RateLimit-* / RateLimit-* headers
+    (GitHub and GitLab) and Retry-After. Once the remaining budget is low,
+    requests are spread evenly until the budget resets. Hosts that are throttled
+    raise RateLimitExceeded right away, so the lookup can be deferred while
+    packages of other hosts continue.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        # host -> {"limit", "remaining", "reset", "next_slot", "blocked_until"}
+        self.__hosts = {}
+
+    def before_request(self, host: str):
+        """Wait for the next free request slot of `host`
+
+        Raises: RateLimitExceeded if the host is throttled or the next
+                slot is too far in the future
+        """
+        with self.__lock:
+            state = self.__hosts.setdefault(host, {})
+            now = time.time()
+            if state.get("blocked_until", 0) > now:
+                raise RateLimitExceeded(host, state["blocked_until"])
+
+            slot = now
+            remaining = state.get("remaining")
+            limit = state.get("limit")
+            reset = state.get("reset", 0)
+            # Only pace requests if the budget is running low, otherwise
+            # requests are sent as fast as the host allows
+            if (
+                remaining is not None
+                and limit
+                and remaining <= limit * RATE_LIMIT_PACING_THRESHOLD
+                and reset > now
+            ):
+                if remaining <= 0:
+                    state["blocked_until"] = reset
+                    raise RateLimitExceeded(host, reset)
+                slot = max(now, state.get("next_slot", now))
+                # Deferred requests are not sent, so they must not use up
+                # the budget or push back the schedule
+                if slot - now > RATE_LIMIT_MAX_PACING_DELAY:
+                    raise RateLimitExceeded(host, slot)
+                state["next_slot"] = slot + (reset - now) / remaining
+                state["remaining"] = remaining - 1
+
+        if slot > now:
+            time.sleep(slot - now)
+
+    def after_response(self, host: str, response: requests.Response) -> bool:
+        """Update the budget of `host` from the response headers
 
+        Returns: Whether the response was rejected because of the rate limit
+        """
+        headers = response.headers
+        now = time.time()
+        with self.__lock:
+            state = self.__hosts.setdefault(host, {})
+            for key, header in (
+                ("limit", "RateLimit-Limit"),
+                ("remaining", "RateLimit-Remaining"),
+                ("reset", "RateLimit-Reset"),
+            ):
+                value = headers.get(f"X-{header}", headers.get(header))
+                if value is not None and value.isdigit():
+                    state[key] = int(value)
 
-def http_get(url: str) -> requests.Response:
-    user_agent = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/96.0.4664.110 Safari/537.36"
-    return requests_session.get(
-        url, allow_redirects=True, headers={"User-Agent": user_agent}
+            if response.status_code not in (403, 429):
+                return False
+
+            retry_after = parse_retry_after(headers.get("Retry-After"))
+            if retry_after is not None:
+                state["blocked_until"] = now + retry_after
+            elif state.get("remaining") == 0 or response.status_code == 429:
+                state["blocked_until"] = max(
+                    state.get("reset", 0), now + RATE_LIMIT_DEFAULT_BACKOFF
+                )
+            else:
+                # A 403 that has nothing to do with the rate limit
+                return False
+
+            return True
+
+    def blocked_until(self, host: str) -> float:
+        """Point in time (epoch) after which requests to `host` are allowed again"""
+        with self.__lock:
+            state = self.__hosts.get(host, {})
+            return max(state.get("blocked_until", 0), state.get("next_slot", 0))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse the Retry-After header into a number of seconds"""
+    if value is None:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+setup_http_session(DEFAULT_JOBS, {})
+# Keeps track of the rate limits of all hosts
+rate_limit_scheduler = RateLimitScheduler()
+
+
+def http_get(url: str, headers: dict | None = None) -> requests.Response:
+    headers = {"User-Agent": USER_AGENT, **(headers or {})}
+
+    host = urlparse(url).netloc
+    cached = http_cache.load(url) if http_cache is not None else None
+    if cached is not None:
+        if http_cache.is_fresh(cached):
+            with profiling.span("http (cached)", host):
+                return http_cache.response(cached)
+        # Ask the server whether our cached response is still up to date
+        headers.update(http_cache.conditional_headers(cached))
+
+    rate_limit_scheduler.before_request(host)
+    with host_semaphore(host), profiling.span("http", host):
+        response = requests_session.get(url, allow_redirects=True, headers=headers)
+    if rate_limit_scheduler.after_response(host, response):
+        raise RateLimitExceeded(host, rate_limit_scheduler.blocked_until(host))
+
+    if http_cache is not None:
+        if response.status_code == 304 and cached is not None:
+            http_cache.refresh(url, cached, response)
+            return http_cache.response(cached)
+        elif response.status_code == 200:
+            http_cache.store(url, response)
+
+    return response
+
+
+def http_post(url: str, data: dict, headers: dict | None = None) -> requests.Response:
+    headers = {"User-Agent": USER_AGENT, **(headers or {})}
+    # GraphQL endpoints have their own rate limit budget
+    bucket = urlparse(url).netloc + urlparse(url).path
+    rate_limit_scheduler.before_request(bucket)
+    with host_semaphore(urlparse(url).netloc), profiling.span("http", bucket):
+        response = requests_session.post(url, json=data, headers=headers)
+    if rate_limit_scheduler.after_response(bucket, response):
+        raise RateLimitExceeded(bucket, rate_limit_scheduler.blocked_until(bucket))
+
+    return response
+
+
+def preprocess_spec_file(path: str) -> str | None:
+    """Run `rpmspec -P` on a spec file
+
+    Parameters:
+        path: Path to the spec file
+
+    Returns: The preprocessed spec file or None if rpmspec failed
+    """
+    result = exec_cmd(
+        "rpmspec",
+        ["-P", path],
+        check_result=False,
+        subprocess_arguments={"capture_output": True},
     )
+    if result.returncode != 0:
+        return None
 
+    return result.stdout.decode("utf-8")
 
-def gather_package_information(path: str) -> list[dict]:
+
+def parse_spec_file_with_librpm(path: str) -> tuple[str, str, str] | None:
+    """Read name, version and Source0 of a spec file with the rpm python bindings
+
+    This parses the spec file with librpm, no rpmspec process is spawned.
+    librpm keeps global state, so this must not be called from multiple threads.
+    gather_package_information calls it in worker processes instead.
+
+    Parameters:
+        path: Path to the spec file
+
+    Returns: Tuple of name, version and source or None if the spec file
+             could not be parsed
+    """
+    try:
+        spec = rpm.spec(path)
+        header = spec.sourceHeader
+        name = header[rpm.RPMTAG_NAME]
+        version = header[rpm.RPMTAG_VERSION]
+        # Every source is a tuple of URL, number and flags, patches have
+        # the same format so we only consider real sources
+        source = next(
+            (
+                url
+                for url, number, flags in spec.sources
+                if number == 0 and flags & RPMBUILD_ISSOURCE
+            ),
+            None,
+        )
+    except Exception:
+        return None
+    finally:
+        # Macros that were defined by the spec file must not leak into the next one
+        rpm.reloadConfig()
+
+    if not name or not version or not source:
+        return None
+
+    return tuple(
+        value.decode("utf-8") if isinstance(value, bytes) else value
+        for value in (name, version, source)
+    )
+
+
+def init_librpm_worker():
+    """Set up a worker process for parse_spec_file_with_librpm"""
+    # Spec files that librpm can't parse are preprocessed with rpmspec,
+    # which reports the error, so librpm must not print it as well
+    rpm.setVerbosity(rpm.RPMLOG_CRIT)
+
+
+def rpm_macro_fingerprint() -> str:
+    """Fingerprint of the rpm macro environment
+
+    The preprocessed spec files depend on the installed rpm macros,
+    e.g. an updated rust-packaging can change the expanded Source0.
+    The fingerprint changes whenever rpm or one of its macro files changes.
+
+    Returns: Hash over the rpm version and all macro files
+    """
+    fingerprint = hashlib.sha256(rpm.__version__.encode("utf-8"))
+    for pattern in RPM_MACRO_FILES:
+        for path in sorted(glob.glob(os.path.expanduser(pattern))):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            fingerprint.update(f"{path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+
+    return fingerprint.hexdigest()
+
+
+def package_shard(package_directory: str, shard_count: int) -> int:
+    """Compute the shard a package belongs to
+
+    The shard only depends on the name of the package directory, so every
+    machine assigns the same packages to the same shards.
+
+    Parameters:
+        package_directory: Path of the package directory
+        shard_count: Total number of shards
+
+    Returns: Shard number, starting at 1
+    """
+    name = os.path.basename(os.path.normpath(package_directory))
+    digest = hashlib.sha256(name.encode("utf-8")).digest()
+
+    return int.from_bytes(digest[:8], "big") % shard_count + 1
+
+
+def gather_package_information(
+    path: str,
+    jobs: int | None = None,
+    use_cache: bool = True,
+    shard: tuple[int, int] | None = None,
+) -> list[dict]:
+    """Collect name, version and source of all packages in `path`
+
+    Spec files are parsed with librpm, `rpmspec -P` is only used as a fallback.
+
+    Parameters:
+        path: Parent directory of all package directories
+        jobs: Number of spec files that are parsed with librpm or preprocessed
+              with rpmspec at the same time. Defaults to the number of CPUs.
+        use_cache: Whether to reuse the information of unchanged spec files
+                   from previous runs. The cache is updated in both cases.
+        shard: Only collect the packages of shard `i` of `n` shards (see package_shard)
+
+    Returns: List of packages in the order of the found spec files
+    """
     packages = []
+    spec_files = glob.glob(os.path.join(path, "*/*.spec"))
+    if shard is not None:
+        spec_files = [
+            spec_file
+            for spec_file in spec_files
+            if package_shard(os.path.dirname(spec_file), shard[1]) == shard[0]
+        ]
+    macros = rpm_macro_fingerprint()
+    spec_cache = load_json_cache(SPEC_CACHE_FILE)
+    # The whole cache is invalid if the rpm macros have changed
+    if not use_cache or spec_cache.get("macros") != macros:
+        spec_cache = {"macros": macros, "specs": {}}
+
+    spec_hashes = {}
+    for path in spec_files:
+        with open(path, "rb") as f:
+            spec_hashes[path] = hashlib.sha256(f.read()).hexdigest()
+    # Only spec files that have changed since the last run need to be preprocessed
+    changed_spec_files = [
+        path
+        for path in spec_files
+        if spec_cache["specs"].get(os.path.abspath(path), {}).get("hash")
+        != spec_hashes[path]
+    ]
+
+    # Spec files are parsed with librpm, rpmspec is only used for spec files
+    # that librpm cannot parse. librpm keeps global state, so every worker
+    # process has its own.
+    parsed_spec_files = {}
+    if changed_spec_files:
+        workers = min(jobs or os.cpu_count(), len(changed_spec_files))
+        with profiling.span("librpm", "specs"), ProcessPoolExecutor(
+            max_workers=workers, initializer=init_librpm_worker
+        ) as executor:
+            for path, parsed in zip(
+                changed_spec_files,
+                executor.map(
+                    parse_spec_file_with_librpm,
+                    changed_spec_files,
+                    # Fewer round trips between the processes
+                    chunksize=max(1, len(changed_spec_files) // (workers * 4)),
+                ),
+            ):
+                if parsed is not None:
+                    parsed_spec_files[path] = parsed
+    fallback_spec_files = [
+        path for path in changed_spec_files if path not in parsed_spec_files
+    ]
+
+    # rpmspec runs in its own process, so threads are enough to use all cores
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        preprocessed_spec_files = dict(
+            zip(
+                fallback_spec_files,
+                executor.map(preprocess_spec_file, fallback_spec_files),
+            )
+        )
+
     # Iterate over all found spec files
-    for path in glob.glob(os.path.join(path, "*/*.spec")):
+    for path in spec_files:
         # Name of the package
         name = None
         # Current version of the pacakge
@@ -53,30 +534,34 @@ def gather_package_information(path: str) -> list[dict]:
         # Source of the package
         source = None
 
-        result = exec_cmd(
-            "rpmspec",
-            ["-P", path],
-            check_result=False,
-            subprocess_arguments={"capture_output": True},
-        )
-        if result.returncode != 0:
+        if path in parsed_spec_files:
+            name, version, source = parsed_spec_files[path]
+        elif path not in preprocessed_spec_files:
+            cached = spec_cache["specs"][os.path.abspath(path)]
+            name, version, source = cached["name"], cached["version"], cached["source"]
+        elif (content := preprocessed_spec_files[path]) is None:
             LOGGER.error(f"Could not process: {path}")
             continue
-
-        content = result.stdout.decode("utf-8")
-        # Iterate over all line and get the needed information
-        for line in content.split("\n"):
-            if match := NAME_TAG.match(line):
-                name = match.group(1)
-            elif match := SOURCE_TAG.match(line):
-                source = match.group(1)
-            elif match := VERSION_TAG.match(line):
-                version = match.group(1)
+        else:
+            # Iterate over all line and get the needed information
+            for line in content.split("\n"):
+                if match := NAME_TAG.match(line):
+                    name = match.group(1)
+                elif match := SOURCE_TAG.match(line):
+                    source = match.group(1)
+                elif match := VERSION_TAG.match(line):
+                    version = match.group(1)
 
         if name is None or version is None or source is None:
             LOGGER.warning(f"Could not parse {path} correctly!")
             continue
 
+        spec_cache["specs"][os.path.abspath(path)] = {
+            "hash": spec_hashes[path],
+            "name": name,
+            "version": version,
+            "source": source,
+        }
         packages.append(
             {
                 "name": name,
@@ -87,103 +572,574 @@ def gather_package_information(path: str) -> list[dict]:
             }
         )
 
+    write_json_cache(SPEC_CACHE_FILE, spec_cache)
+
     return packages
 
 
-def lookup_version_by_prefix(versions: list, raw_prefix: str) -> str | None:
+def version_matches_prefix(version: str, raw_prefix: str) -> bool:
     # Differentiate between prefixes and (not) prefixes
     # prefixes are used to only consider versions that start with them
     # (not) prefixes are used to ignore versions that start with them
     if raw_prefix.startswith("!"):
-        prefix = raw_prefix[1:]
-    else:
-        prefix = raw_prefix
+        return not version.startswith(raw_prefix[1:])
 
-    # We assume versions is already sorted from latest to oldest versions
-    for version in versions:
-        if raw_prefix.startswith("!"):
-            if version.startswith(prefix):
-                continue
-            else:
-                return version
+    return version.startswith(raw_prefix)
+
+
+@functools.lru_cache(maxsize=VERSION_KEY_CACHE_SIZE)
+def version_key(tag: str) -> tuple | None:
+    """Parse a tag into a key that sorts like rpmvercmp
+
+    Everything before the first digit is treated as a prefix and ignored
+    ("v1.2", "release-1.2" and "1.2" have the same key). Numeric segments are
+    newer than alphabetic ones and are compared as numbers. "~" as well as
+    pre-release markers ("1.0-rc1", "1.0.0-beta.2", "1.0a1") sort before the
+    release itself, while a trailing letter ("1.1.1a") sorts after it.
+    Semver build metadata ("+...") is ignored.
+    Keys of recently seen tags are cached, so they are only parsed once.
+
+    Parameters:
+        tag: Tag name
+
+    Returns: Comparable key or None if the tag does not look like a version
+    """
+    if (match := re.search(r"\d", tag)) is None:
+        return None
+
+    key = []
+    segments = VERSION_SEGMENT.findall(tag[match.start() :].split("+")[0])
+    for index, segment in enumerate(segments):
+        if (
+            segment == "~"
+            or segment.lower() in PRE_RELEASE_MARKERS
+            or (
+                segment.lower() in SHORT_PRE_RELEASE_MARKERS
+                and index + 1 < len(segments)
+                and segments[index + 1].isdigit()
+            )
+        ):
+            key.append((-1, ""))
+            if segment != "~":
+                key.append((1, segment.lower()))
+        elif segment.isdigit():
+            key.append((2, int(segment)))
         else:
-            if version.startswith(prefix):
-                return version
+            key.append((1, segment.lower()))
+    # The end of a version is older than any additional segment, but newer
+    # than a pre-release
+    key.append((0, ""))
+
+    return tuple(key)
+
+
+def newest_version(tags: list[str]) -> str | None:
+    """Select the newest version from a list of tags
+
+    Parameters:
+        tags: Tag names in the order the forge returned them
+
+    Returns: The tag with the highest version key. If no tag looks like a version
+             the first tag is returned, as the forge order is all we have.
+    """
+    versions = [(key, tag) for tag in tags if (key := version_key(tag)) is not None]
+    if not versions:
+        return tags[0] if tags else None
+
+    return max(versions, key=lambda version: version[0])[1]
+
+
+def select_latest_version(
+    tag_pages: Iterable[list[str]], project_name: str, config: dict
+) -> str | None:
+    """Select the latest version from upstream tags
+
+    The forges don't sort tags by version, so the newest version is selected
+    from the tags of all pages (see iter_tag_pages, which stops after
+    "max-tag-pages" pages). With an upstream-version-prefix rule only
+    matching tags are considered.
+
+    Parameters:
+        tag_pages: Pages of tag names
+        project_name: Upstream project name, used to look up the configured version prefix
+        config: Configuration of the check-versions command
+
+    Returns: The latest version or None if no tag matches
+    """
+    raw_prefix = None
+    # Check whether we have to look for a specific version prefix
+    if check_value_of_key_in_list_of_dicts(
+        "name", project_name, config.get("upstream-version-prefix", [])
+    ):
+        raw_prefix = search_for_dict_in_list_of_dicts_and_get_value(
+            "prefix",
+            lambda item: item.get("name") == project_name,
+            config["upstream-version-prefix"],
+        )
+
+    candidates = []
+    for page in tag_pages:
+        candidates.extend(
+            tag
+            for tag in page
+            if raw_prefix is None or version_matches_prefix(tag, raw_prefix)
+        )
+
+    return newest_version(candidates)
+
+
+def iter_tag_pages(
+    url: str,
+    max_pages: int,
+    headers: dict | None = None,
+    response: requests.Response | None = None,
+) -> Iterator[list[str]]:
+    """Lazily iterate over the pages of a paginated GitHub / GitLab tag list
+
+    The next page is only fetched when it is requested.
+    Pages are fetched with http_get, so they are cached as well.
+
+    Parameters:
+        url: URL of the first page
+        max_pages: Maximum number of pages that will be fetched
+        headers: Additional headers for the requests
+        response: Already fetched response of the first page
+
+    Returns: Iterator over the tag names of every page, sorted like the API returns them
+    """
+    for _ in range(max_pages):
+        if response is None:
+            response = http_get(url, headers)
+        if response.status_code != 200 or not isinstance(
+            tags := response.json(), list
+        ):
+            LOGGER.error(f"Could not fetch tags from {url}")
+            LOGGER.error(f"REASON: {response.text}")
+            return
+
+        yield [tag["name"] for tag in tags]
+
+        # GitHub and GitLab both announce the next page in the Link header
+        if (url := response.links.get("next", {}).get("url")) is None:
+            return
+        response = None
+
+
+def github_project(source) -> tuple[str, str] | None:
+    """Get the GitHub organisation and project name from a parsed source URL
+
+    Returns: Tuple of organisation and project name or None if the URL is not supported
+    """
+    # [1:] --> ignore first slash in the path
+    url_path = source.path[1:].split("/")
+    if len(url_path) > 2 and url_path[2] in ("archive", "releases"):
+        # https://github.com/<user>/<proj>/archive/<tag>/<file>
+        # https://github.com/<user>/<proj>/releases/download/<tag>/<file>
+        return url_path[0], url_path[1]
+    elif len(url_path) > 2 and url_path[0] == "downloads":
+        return url_path[1], url_path[2]
 
     return None
 
 
-def get_latest_package_version(package: dict, config: dict) -> str | None:
-    latest_version = None
+def github_headers(config: dict) -> dict:
+    """Authorization headers for the GitHub API if a token is configured"""
+    token = config.get("github-token") or os.environ.get("GITHUB_TOKEN")
+    return {"Authorization": f"bearer {token}"} if token else {}
 
-    if urlparse(package["source"]).netloc == "crates.io":
-        # https://crates.io/api/v1/crates/<crate_name>
-        if package["name"].startswith("rust-"):
-            crate_name = package["name"][5:]
-        else:
-            crate_name = package["name"]
-
-        # This is the case when the package name
-        # differs from the crate name
-        # Example: libimagequant
-        if crate_name not in package["source"]:
-            # Here we assume that the crate source
-            # has the format: https://crates.io/api/v1/crates/%name/%version/download#/%name-%version.crate
-            crate_name = (
-                package["source"]
-                .split("https://crates.io/api/v1/crates/")[1]
-                .split("/")[0]
+
+def github_refs_query(after: str | None = None) -> str:
+    """GraphQL selection of a page of tags, sorted from latest to oldest
+
+    Parameters:
+        after: Cursor of the previous page or None for the first page
+    """
+    cursor = f", after: {json.dumps(after)}" if after is not None else ""
+
+    return (
+        f'refs(refPrefix: "refs/tags/", first: {GITHUB_GRAPHQL_TAGS}{cursor},'
+        " orderBy: {field: TAG_COMMIT_DATE, direction: DESC})"
+        " { nodes { name } pageInfo { hasNextPage endCursor } }"
+    )
+
+
+def github_refs_page(refs: dict) -> tuple[list[str], str | None]:
+    """Get the tag names and the cursor of the next page from a GraphQL refs result"""
+    page_info = refs["pageInfo"]
+
+    return (
+        [node["name"] for node in refs["nodes"]],
+        page_info["endCursor"] if page_info["hasNextPage"] else None,
+    )
+
+
+def iter_github_graphql_tag_pages(
+    project: tuple[str, str], max_pages: int, config: dict
+) -> Iterator[list[str]]:
+    """Lazily iterate over the tag pages of a prefetched GitHub project
+
+    The first page comes from prefetch_github_tags, further pages are fetched
+    with GraphQL as well, so all pages share the same order.
+
+    Parameters:
+        project: Organisation and project name
+        max_pages: Maximum number of pages, including the prefetched one
+        config: Configuration of the check-versions command
+
+    Returns: Iterator over the tag names of every page
+    """
+    tags, cursor = github_tags[project]
+    yield tags
+
+    org, name = project
+    for _ in range(max_pages - 1):
+        if cursor is None:
+            return
+        response = http_post(
+            GITHUB_GRAPHQL_URL,
+            {
+                "query": f"{{ repository(owner: {json.dumps(org)}, name: {json.dumps(name)})"
+                f" {{ {github_refs_query(cursor)} }} }}"
+            },
+            github_headers(config),
+        )
+        if response.status_code != 200 or not (
+            repository := (response.json().get("data") or {}).get("repository")
+        ):
+            LOGGER.error(
+                f"Could not fetch tags of {org}/{name} with the GitHub GraphQL API"
             )
+            LOGGER.error(f"REASON: {response.text}")
+            return
+
+        tags, cursor = github_refs_page(repository["refs"])
+        yield tags
+
 
-        response = http_get(f"https://crates.io/api/v1/crates/{crate_name}")
+def prefetch_github_tags(packages: list[dict], config: dict) -> dict:
+    """Fetch the tags of all GitHub projects with a few GraphQL queries
 
+    Every query contains up to GITHUB_GRAPHQL_BATCH_SIZE aliased repositories.
+    The GraphQL API requires a token, without it nothing is prefetched and
+    the tags are fetched per package with the REST API.
+
+    Parameters:
+        packages: All packages that will be checked
+        config: Configuration of the check-versions command
+
+    Returns: Dictionary that maps (organisation, project name) to the first
+             page of tag names, sorted from latest to oldest, and the cursor
+             of the next page (None if there are no more tags)
+    """
+    tags = {}
+    headers = github_headers(config)
+    if not headers:
+        return tags
+
+    projects = sorted(
+        {
+            project
+            for package in packages
+            if (source := urlparse(package["source"])).netloc == "github.com"
+            and (project := github_project(source)) is not None
+        }
+    )
+    for start in range(0, len(projects), GITHUB_GRAPHQL_BATCH_SIZE):
+        batch = projects[start : start + GITHUB_GRAPHQL_BATCH_SIZE]
+        query = " ".join(
+            f"r{index}: repository(owner: {json.dumps(org)}, name: {json.dumps(name)})"
+            f" {{ {github_refs_query()} }}"
+            for index, (org, name) in enumerate(batch)
+        )
+        try:
+            response = http_post(
+                GITHUB_GRAPHQL_URL, {"query": f"{{ {query} }}"}, headers
+            )
+        except RateLimitExceeded:
+            LOGGER.warning(
+                "GitHub GraphQL rate limit exceeded, remaining tags are fetched per package"
+            )
+            break
         if response.status_code != 200:
-            LOGGER.error(f"Could not fetch crate information for {crate_name}")
+            LOGGER.error("Could not fetch tags with the GitHub GraphQL API")
             LOGGER.error(f"REASON: {response.text}")
+            continue
+
+        # Repositories that could not be resolved are null and will be
+        # looked up with the REST API later
+        data = response.json().get("data") or {}
+        for index, project in enumerate(batch):
+            if repository := data.get(f"r{index}"):
+                tags[project] = github_refs_page(repository["refs"])
+
+    return tags
+
+
+def crate_name(package: dict) -> str:
+    """Get the crate name of a rust package"""
+    # https://crates.io/api/v1/crates/<crate_name>
+    if package["name"].startswith("rust-"):
+        crate_name = package["name"][5:]
+    else:
+        crate_name = package["name"]
+
+    # This is the case when the package name
+    # differs from the crate name
+    # Example: libimagequant
+    if crate_name not in package["source"]:
+        # Here we assume that the crate source
+        # has the format: https://crates.io/api/v1/crates/%name/%version/download#/%name-%version.crate
+        crate_name = (
+            package["source"]
+            .split("https://crates.io/api/v1/crates/")[1]
+            .split("/")[0]
+        )
+
+    return crate_name
+
+
+def latest_crate_version_from_api(crate_name: str) -> str | None:
+    """Get the latest version of a crate from the crates.io API"""
+    response = http_get(f"https://crates.io/api/v1/crates/{crate_name}")
+
+    if response.status_code != 200:
+        LOGGER.error(f"Could not fetch crate information for {crate_name}")
+        LOGGER.error(f"REASON: {response.text}")
+        return
+    else:
+        response = response.json()
+
+    if "crate" not in response:
+        LOGGER.warning(f"Could not determine the latest version of {crate_name}")
+        return
+
+    return response["crate"].get("max_version", None)
+
+
+def sparse_index_path(crate_name: str) -> str:
+    """Path of a crate in the crates.io sparse index
+
+    See https://doc.rust-lang.org/cargo/reference/registry-index.html#index-files
+    """
+    crate_name = crate_name.lower()
+    if len(crate_name) <= 2:
+        return f"{len(crate_name)}/{crate_name}"
+    elif len(crate_name) == 3:
+        return f"3/{crate_name[0]}/{crate_name}"
+
+    return f"{crate_name[0:2]}/{crate_name[2:4]}/{crate_name}"
+
+
+def semver_key(version: str) -> tuple[int, ...] | None:
+    """Sortable key of a stable semver version or None for other versions"""
+    # Build metadata is ignored when comparing versions
+    version = version.split("+")[0]
+    if "-" in version:
+        return None
+    try:
+        return tuple(int(part) for part in version.split("."))
+    except ValueError:
+        return None
+
+
+def latest_crate_version_from_index(crate_name: str) -> str | None:
+    """Get the latest version of a crate from the crates.io sparse index
+
+    The index is a static file per crate that is not rate-limited like the API.
+    Yanked and pre-release versions are ignored.
+    """
+    response = http_get(f"{CRATES_SPARSE_INDEX_URL}/{sparse_index_path(crate_name)}")
+
+    if response.status_code != 200:
+        LOGGER.error(f"Could not fetch crate information for {crate_name}")
+        LOGGER.error(f"REASON: {response.text}")
+        return
+
+    # Every line of the index file describes one published version
+    versions = []
+    for line in response.text.splitlines():
+        if not line.strip():
+            continue
+        release = json.loads(line)
+        if release.get("yanked") is False and (
+            key := semver_key(release["vers"])
+        ):
+            versions.append((key, release["vers"]))
+
+    if not versions:
+        LOGGER.warning(f"Could not determine the latest version of {crate_name}")
+        return
+
+    return max(versions)[1]
+
+
+def gitlab_project_id(host: str, project_path: str) -> int | None:
+    """Resolve the ID of a GitLab project
+
+    The project is looked up by its full path, resolved IDs are kept in
+    `gitlab_project_ids` and are persisted between runs.
+
+    Parameters:
+        host: Host of the GitLab instance
+        project_path: Full path of the project, e.g. "<group>/<subgroup>/<proj>"
+
+    Returns: The project ID or None if the project does not exist
+    """
+    key = f"{host}/{project_path}"
+    with gitlab_project_ids_lock:
+        if key in gitlab_project_ids:
+            return gitlab_project_ids[key]
+
+    response = http_get(
+        f"https://{host}/api/v4/projects/{quote(project_path, safe='')}"
+    )
+    if response.status_code != 200:
+        LOGGER.error(f"Could not find GitLab project {key}")
+        return None
+
+    project_id = response.json().get("id")
+    with gitlab_project_ids_lock:
+        gitlab_project_ids[key] = project_id
+
+    return project_id
+
+
+def gitlab_tag_pages(
+    host: str, project_path: str, max_pages: int
+) -> Iterator[list[str]]:
+    """Lazily iterate over the tag pages of a GitLab project
+
+    Parameters:
+        host: Host of the GitLab instance
+        project_path: Full path of the project, e.g. "<group>/<subgroup>/<proj>"
+        max_pages: Maximum number of tag pages that will be fetched
+
+    Returns: Iterator over the tag names of every page
+    """
+    # A cached ID may be outdated if the project was moved or deleted,
+    # in this case the ID is resolved again
+    for _ in range(2):
+        if (project_id := gitlab_project_id(host, project_path)) is None:
             return
+
+        url = f"https://{host}/api/v4/projects/{project_id}/repository/tags?order_by=updated&sort=desc&per_page=100"
+        response = http_get(url)
+        if response.status_code != 404:
+            break
+        with gitlab_project_ids_lock:
+            gitlab_project_ids.pop(f"{host}/{project_path}", None)
+
+    yield from iter_tag_pages(url, max_pages, response=response)
+
+
+def fetch_anitya_packages(query: str) -> dict:
+    """Fetch Fedora packages that are known to Anitya
+
+    Parameters:
+        query: Additional query parameters, e.g. "page=2" or "name=rust-foo"
+    """
+    response = http_get(
+        f"{ANITYA_PACKAGES_URL}?distribution=Fedora"
+        f"&items_per_page={ANITYA_ITEMS_PER_PAGE}&{query}"
+    )
+    if response.status_code != 200:
+        LOGGER.error(f"Could not fetch the Anitya packages ({query})")
+        LOGGER.error(f"REASON: {response.text}")
+        return {}
+
+    return response.json()
+
+
+def prefetch_anitya_versions(packages: list[dict], jobs: int) -> dict:
+    """Fetch the latest versions of all Fedora packages from release-monitoring.org
+
+    Anitya lists all Fedora packages it monitors with ANITYA_ITEMS_PER_PAGE
+    packages per page. Listing all pages only pays off for large trees,
+    if there are fewer packages left than pages, they are queried by name.
+
+    Parameters:
+        packages: All packages that will be checked
+        jobs: Number of pages that are fetched at the same time
+
+    Returns: Dictionary that maps the package name to its Anitya project name
+             and latest version
+    """
+    versions = {}
+    package_names = {package["name"] for package in packages}
+
+    def add_versions(response: dict):
+        for item in response.get("items", []):
+            version = item.get("stable_version") or item.get("version")
+            if item["name"] in package_names and version:
+                versions[item["name"]] = (item["project"], version)
+
+    try:
+        first_page = fetch_anitya_packages("page=1")
+        add_versions(first_page)
+        pages = -(-first_page.get("total_items", 0) // ANITYA_ITEMS_PER_PAGE)
+        missing_names = sorted(package_names - versions.keys())
+        if len(missing_names) < pages - 1:
+            queries = [f"name={quote(name)}" for name in missing_names]
         else:
-            response = response.json()
+            queries = [f"page={page}" for page in range(2, pages + 1)]
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for response in executor.map(fetch_anitya_packages, queries):
+                add_versions(response)
+    except RateLimitExceeded:
+        LOGGER.warning("Anitya rate limit exceeded, all packages are looked up upstream")
+        return {}
 
-        if "crate" not in response:
-            LOGGER.warning(f"Could not determine the latest version of {crate_name}")
-            return
-        latest_version = response["crate"].get("max_version", None)
-    elif (source := urlparse(package["source"])).netloc == "github.com":
-        # [1:] --> ignore first slash in the path
-        url_path = source.path[1:].split("/")
-        if url_path[2] in ("archive", "releases"):
-            # https://github.com/<user>/<proj>/archive/<tag>/<file>
-            # https://github.com/<user>/<proj>/releases/download/<tag>/<file>
-            project_org = url_path[0]
-            project_name = url_path[1]
-        elif url_path[0] == "downloads":
-            project_org = url_path[1]
-            project_name = url_path[2]
+    return versions
+
+
+def anitya_version(package: dict, config: dict) -> str | None:
+    """Latest version of a package according to Anitya, if it can be used"""
+    if package["name"] not in anitya_versions:
+        return None
+
+    project_name, version = anitya_versions[package["name"]]
+    # Anitya only knows the latest version, upstream-version-prefix
+    # rules have to be applied to the upstream tags
+    for name in (package["name"], project_name):
+        if check_value_of_key_in_list_of_dicts(
+            "name", name, config.get("upstream-version-prefix", [])
+        ):
+            return None
+
+    return version
+
+
+def get_latest_package_version(package: dict, config: dict) -> str | None:
+    latest_version = None
+    max_tag_pages = config.get("max-tag-pages", DEFAULT_MAX_TAG_PAGES)
+
+    if (version := anitya_version(package, config)) is not None:
+        return version
+
+    if urlparse(package["source"]).netloc == "crates.io":
+        if config.get("crates-backend", "api") == "sparse-index":
+            latest_version = latest_crate_version_from_index(crate_name(package))
         else:
+            latest_version = latest_crate_version_from_api(crate_name(package))
+    elif (source := urlparse(package["source"])).netloc == "github.com":
+        if (project := github_project(source)) is None:
             LOGGER.error("Unsupported source URL for GitHub!!")
             return
+        project_org, project_name = project
 
-        response = http_get(
-            f"https://api.github.com/repos/{project_org}/{project_name}/tags"
-        ).json()
-        if response is dict and "API rate limit exceeded" in response.get(
-            "message", ""
-        ):
-            return None
-        # Check whether we have to look for a specific version prefix
-        if check_value_of_key_in_list_of_dicts(
-            "name", project_name, config["upstream-version-prefix"]
-        ):
-            latest_version = lookup_version_by_prefix(
-                list(map(lambda version: version["name"], response)),
-                search_for_dict_in_list_of_dicts_and_get_value(
-                    "prefix",
-                    lambda item: item.get("name") == project_name,
-                    config["upstream-version-prefix"],
-                ),
-            )
+        if project in github_tags:
+            # The first page was already fetched together with other projects.
+            # The REST API sorts tags differently, so further pages must
+            # come from GraphQL as well.
+            tag_pages = iter_github_graphql_tag_pages(project, max_tag_pages, config)
         else:
-            latest_version = response[0].get("name", None)
+            tag_pages = iter_tag_pages(
+                f"https://api.github.com/repos/{project_org}/{project_name}/tags?per_page=100",
+                max_tag_pages,
+                github_headers(config),
+            )
+
+        latest_version = select_latest_version(tag_pages, project_name, config)
     elif "gitlab" in (source := urlparse(package["source"])).netloc:
         # [1:] --> ignore first slash in the path
         project_path = source.path[1:].split("/-/")
@@ -197,34 +1153,12 @@ def get_latest_package_version(package: dict, config: dict) -> str | None:
             # Get the project name from the project path
             # This is normally the last string in the path
             project_name = project_path[0].split("/")[-1]
-            project_id = http_get(
-                f"https://{source.netloc}/api/v4/projects?search={project_name}"
-            ).json()
-            # We want to make sure that we got the right project
-            # if the search was not clear, then we cannot assume
-            # that we got the right project
-            if len(project_id) == 0 or len(project_id) > 1:
-                return
-            else:
-                project_id = project_id[0].get("id")
 
-        response = http_get(
-            f"https://{source.netloc}/api/v4/projects/{project_id}/repository/tags?order_by=updated&sort=desc"
-        ).json()
-        # Check whether we have to look for a specific version prefix
-        if check_value_of_key_in_list_of_dicts(
-            "name", project_name, config["upstream-version-prefix"]
-        ):
-            latest_version = lookup_version_by_prefix(
-                list(map(lambda version: version["name"], response)),
-                search_for_dict_in_list_of_dicts_and_get_value(
-                    "prefix",
-                    lambda item: item.get("name") == project_name,
-                    config["upstream-version-prefix"],
-                ),
-            )
-        else:
-            latest_version = response[0].get("name", None)
+        latest_version = select_latest_version(
+            gitlab_tag_pages(source.netloc, project_path[0], max_tag_pages),
+            project_name,
+            config,
+        )
     elif (source := urlparse(package["source"])).netloc in (
         "files.pythonhosted.org",
         "pypi.python.org",
@@ -242,39 +1176,171 @@ def get_latest_package_version(package: dict, config: dict) -> str | None:
     return latest_version
 
 
-def generate_tabulate_list(packages: list, version_prefixes: list[str]) -> list[list]:
-    """Generate the list that will be used as the tabulate input
+def lookup_latest_versions(
+    packages: list[dict], config: dict, jobs: int, ignore_errors: bool = False
+) -> Iterator[tuple[int, dict, str | None]]:
+    """Look up the latest upstream version of all packages concurrently
+
+    Packages whose host is rate limited are deferred. They are retried once the
+    rate limit of their host was reset, as long as that happens within the
+    configured "rate-limit-max-wait" seconds. Packages that still could not be
+    looked up are reported and have no latest version.
 
     Parameters:
-        packages: List of packages that will be displayed
+        packages: Packages that should be looked up
+        config: Configuration of the check-versions command
+        jobs: Number of packages that are looked up at the same time
+        ignore_errors: Whether a lookup that raises an exception (e.g. a connection
+                       error or an unexpected API response) is logged and reported
+                       without a latest version, instead of raising the exception
+
+    Returns: Iterator over the index of the package in `packages`, the package and
+             its latest version. The packages are returned as soon as their lookup
+             finished, so the order is not the same as in `packages`.
+    """
+
+    def lookup(package: dict) -> str | RateLimitExceeded | None:
+        try:
+            return get_latest_package_version(package, config)
+        except RateLimitExceeded as e:
+            return e
+        except Exception as e:
+            if not ignore_errors:
+                raise
+            LOGGER.error(f"Could not look up {package['name']}: {e!r}")
+            return None
+
+    pending = list(enumerate(packages))
+    max_wait = config.get("rate-limit-max-wait", DEFAULT_RATE_LIMIT_MAX_WAIT)
+    deadline = time.time() + max_wait
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while True:
+            deferred = []
+            futures = {
+                executor.submit(lookup, package): (index, package)
+                for index, package in pending
+            }
+            for future in as_completed(futures):
+                index, package = futures.pop(future)
+                if isinstance(result := future.result(), RateLimitExceeded):
+                    deferred.append((index, package, result))
+                else:
+                    yield index, package, result
+
+            if not deferred:
+                break
+            # Wait for the first throttled host to become available again
+            retry_at = min(error.reset for _, _, error in deferred)
+            if retry_at > deadline:
+                for host in sorted({error.host for _, _, error in deferred}):
+                    errors = [
+                        (package, error)
+                        for _, package, error in deferred
+                        if error.host == host
+                    ]
+                    reset = time.localtime(max(error.reset for _, error in errors))
+                    names = [package["name"] for package, _ in errors]
+                    LOGGER.warning(
+                        f"Rate limit of {host} exceeded until {time.strftime('%H:%M:%S', reset)}, "
+                        f"deferred packages: {', '.join(names)}"
+                    )
+                for index, package, _ in deferred:
+                    yield index, package, None
+                break
+
+            LOGGER.info(
+                f"Retrying {len(deferred)} rate limited package(s) in {max(0, int(retry_at - time.time()))}s"
+            )
+            time.sleep(max(0, retry_at - time.time()))
+            pending = [(index, package) for index, package, _ in deferred]
+
+
+def git_repository(path: str) -> git.Repo:
+    """Return a (reused) handle of the git repository in `path`"""
+    with git_repositories_lock:
+        if path not in git_repositories:
+            git_repositories[path] = git.Repo(path)
+        return git_repositories[path]
+
+
+def collect_git_dirty_states(packages: list[dict], jobs: int | None = None):
+    """Check the git state of all package directories concurrently
+
+    The result is stored as "git_dirty" in every package.
+
+    Parameters:
+        packages: Packages whose git directories should be checked
+        jobs: Number of repositories that are checked at the same time.
+              Defaults to the number of CPUs.
+    """
+
+    def is_dirty(package: dict) -> bool:
+        with profiling.span("git", "is_dirty"):
+            return git_repository(package["git_path"]).is_dirty()
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        dirty_states = executor.map(is_dirty, packages)
+        for package, dirty in zip(packages, dirty_states):
+            package["git_dirty"] = dirty
+
+
+def package_record(package: dict, version_prefixes: list[str]) -> dict:
+    """Summarize the result of a package lookup
+
+    Parameters:
+        package: Package with its looked up "latest_version" and "git_dirty" state
         version_prefixes: Version prefixes that will be forwarded to the compare_two_versions
                           function.
 
-    Returns: Formated list with all packages that need to be updated
+    Returns: Dictionary with name, version, latest version, source,
+             git state and status of the package
     """
-    tabulate_list = []
-    for package in packages:
-        git_dirty = " (dirty)" if git.Repo(package["git_path"]).is_dirty() else ""
-        if package["latest_version"] is None:
-            color = Colors.RED
-            package["latest_version"] = "-"
-        elif compare_two_versions(
-            package["version"], package["latest_version"], version_prefixes
-        ):
-            color = Colors.GREEN
-        else:
-            color = Colors.YELLOW
-
-        tabulate_list.append(
-            [
-                color + package["name"] + git_dirty + Colors.RESET,
-                color + package["version"] + Colors.RESET,
-                color + package["latest_version"] + Colors.RESET,
-                color + package["source"] + Colors.RESET,
-            ]
-        )
+    if package["latest_version"] is None:
+        status = STATUS_UNKNOWN
+    elif compare_two_versions(
+        package["version"], package["latest_version"], version_prefixes
+    ):
+        status = STATUS_UP_TO_DATE
+    else:
+        status = STATUS_OUTDATED
+
+    return {
+        "name": package["name"],
+        "version": package["version"],
+        "latest_version": package["latest_version"],
+        "source": package["source"],
+        "dirty": package["git_dirty"],
+        "status": status,
+    }
+
 
-    return tabulate_list
+def record_row(record: dict) -> list[str]:
+    """Format a package record as a colored table row"""
+    color = STATUS_COLORS[record["status"]]
+    git_dirty = " (dirty)" if record["dirty"] else ""
+
+    return [
+        color + record["name"] + git_dirty + Colors.RESET,
+        color + record["version"] + Colors.RESET,
+        color + (record["latest_version"] or "-") + Colors.RESET,
+        color + record["source"] + Colors.RESET,
+    ]
+
+
+def print_table(records: list[dict]):
+    """Print package records as a table
+
+    Up to date packages are printed first, then outdated packages and at last
+    packages whose latest version is unknown. The order within these groups is kept.
+    """
+    records = sorted(records, key=lambda record: STATUS_ORDER.index(record["status"]))
+    print(
+        tabulate.tabulate(
+            [record_row(record) for record in records],
+            headers=["Name", "Version", "Latest version", "Source"],
+            tablefmt="simple_grid",
+        )
+    )
 
 
 def compare_two_versions(
@@ -302,34 +1368,176 @@ def compare_two_versions(
     return version1 == version2
 
 
+def setup_upstream_lookups(config: dict, jobs: int, use_cache: bool):
+    """Prepare the HTTP session and the caches for upstream lookups
+
+    Parameters:
+        config: Configuration of the check-versions command
+        jobs: Number of packages that are looked up at the same time
+        use_cache: Whether cached data from previous runs should be used
+    """
+    global http_cache
+
+    setup_http_session(jobs, config.get("host-jobs", {}))
+    http_cache = HttpCache(
+        config.get("http-cache-ttl", DEFAULT_HTTP_CACHE_TTL),
+        use_cache=use_cache,
+    )
+    if use_cache:
+        gitlab_project_ids.update(load_json_cache(GITLAB_PROJECTS_CACHE_FILE))
+
+
+def prefetch_upstream_versions(packages: list[dict], config: dict, jobs: int):
+    """Fetch everything that can be fetched in bulk before the per-package lookups
+
+    Parameters:
+        packages: Packages that will be looked up
+        config: Configuration of the check-versions command
+        jobs: Number of requests that are sent at the same time
+    """
+    global github_tags, anitya_versions
+
+    # Results of a previous (e.g. `watch-versions`) round must not be reused
+    # if the prefetch fails
+    github_tags, anitya_versions = {}, {}
+    if config.get("anitya", False):
+        anitya_versions = prefetch_anitya_versions(packages, jobs)
+    # GitHub projects whose version is known from Anitya don't need their tags
+    github_tags = prefetch_github_tags(
+        [package for package in packages if anitya_version(package, config) is None],
+        config,
+    )
+
+
+def print_snapshot():
+    """Print the latest results of `fedtools watch-versions`"""
+    snapshot = load_json_cache(SNAPSHOT_FILE)
+    if not snapshot.get("packages"):
+        LOGGER.error("No snapshot found, is `fedtools watch-versions` running?")
+        exit(1)
+
+    updated_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot["updated_at"]))
+    LOGGER.info(f"Snapshot of {snapshot['path']} from {updated_at}")
+    print_table(list(snapshot["packages"].values()))
+
+
+def write_shard_results(path: str, shard: tuple[int, int] | None, records: list[dict]):
+    """Write the records of a (shard of a) check-versions run as JSON
+
+    Parameters:
+        path: Path of the result file
+        shard: Shard `i` of `n` shards or None if all packages were checked
+        records: Package records in the order of the spec files
+    """
+    write_file_atomically(
+        path,
+        json.dumps(
+            {
+                "shard": list(shard or (1, 1)),
+                "created_at": time.time(),
+                "records": records,
+            },
+            indent=2,
+        ).encode("utf-8"),
+    )
+
+
+def merge_shard_results(paths: list[str]):
+    """Print the results of multiple shards as a single table
+
+    Parameters:
+        paths: Result files written by `check-versions --shard i/n --output FILE`
+    """
+    shards = {}
+    shard_counts = set()
+    records = []
+    for path in paths:
+        try:
+            with open(path, "r") as f:
+                result = json.load(f)
+            shard, shard_count = result["shard"]
+            shard_records = result["records"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            LOGGER.error(f"Could not read shard results from {path}: {e}")
+            exit(1)
+
+        if shard in shards:
+            LOGGER.error(f"{path} and {shards[shard]} contain the same shard {shard}")
+            exit(1)
+        shards[shard] = path
+        shard_counts.add(shard_count)
+        records.extend(shard_records)
+
+    if len(shard_counts) != 1:
+        LOGGER.error(
+            f"The results were split into different numbers of shards: {sorted(shard_counts)}"
+        )
+        exit(1)
+    if missing := sorted(set(range(1, shard_counts.pop() + 1)) - set(shards)):
+        LOGGER.warning(f"Missing results of shard(s): {', '.join(map(str, missing))}")
+
+    # Shards finish in any order, sort by name to get the same table every time
+    records.sort(key=lambda record: record["name"])
+    print_table(records)
+
+
 def check_versions(args: Namespace):
-    packages = gather_package_information(args.path)
+    if args.snapshot:
+        print_snapshot()
+        return
+    if args.merge:
+        merge_shard_results(args.merge)
+        return
+
+    packages = gather_package_information(
+        args.path, args.spec_jobs, use_cache=not args.no_cache, shard=args.shard
+    )
+    if not packages and args.shard is not None:
+        # With few packages some shards are empty, which is not an error
+        LOGGER.warning(f"No packages belong to shard {args.shard[0]}/{args.shard[1]}")
+        if args.output:
+            write_shard_results(args.output, args.shard, [])
+        return
     if not packages:
         LOGGER.error("No packages were found!!")
         exit(1)
 
-    updatable_packages = []
     config = Config().command_config(args.command)
+    jobs = args.jobs or DEFAULT_JOBS
+    setup_upstream_lookups(config, jobs, use_cache=not args.no_cache)
+    collect_git_dirty_states(packages, args.spec_jobs)
+    prefetch_upstream_versions(packages, config, jobs)
 
-    for package in packages:
-        package["latest_version"] = get_latest_package_version(package, config)
-        updatable_packages.append(package)
+    # Most of the time is spent waiting for the upstream APIs, so we query
+    # multiple packages at the same time. Results are printed / collected
+    # as soon as a lookup is finished.
+    records = []
+    status_counts = dict.fromkeys(STATUS_ORDER, 0)
+    version_prefixes = config.get("version-prefix", [])
+    for index, package, latest_version in lookup_latest_versions(
+        packages, config, jobs
+    ):
+        package["latest_version"] = latest_version
+        record = package_record(package, version_prefixes)
+        status_counts[record["status"]] += 1
+        if args.format == "ndjson":
+            print(json.dumps(record), flush=True)
+        elif args.format == "stream":
+            print(" | ".join(record_row(record)), flush=True)
+        # ndjson keeps nothing in memory, unless the results are written to a file
+        if args.output or args.format != "ndjson":
+            records.append((index, record))
+    write_json_cache(GITLAB_PROJECTS_CACHE_FILE, gitlab_project_ids)
 
-    tabulate_list = generate_tabulate_list(
-        updatable_packages, config.get("version-prefix", [])
-    )
-    # Sort packages
-    tabulate_list.sort(
-        key=lambda package: Colors.YELLOW in package[0],
-    )
-    tabulate_list.sort(
-        key=lambda package: Colors.RED in package[0],
-    )
-    if updatable_packages:
-        print(
-            tabulate.tabulate(
-                tabulate_list,
-                headers=["Name", "Version", "Latest version", "Source"],
-                tablefmt="simple_grid",
-            )
-        )
+    # Keep the order of the spec files like a serial run would
+    records.sort(key=lambda item: item[0])
+    records = [record for _, record in records]
+    if args.output:
+        write_shard_results(args.output, args.shard, records)
+    http_cache.evict(config.get("http-cache-max-age", DEFAULT_HTTP_CACHE_MAX_AGE))
+    if args.format == "ndjson":
+        # The sorted table of the other formats would need all records,
+        # so ndjson closes with the number of packages per status instead
+        print(json.dumps({"summary": status_counts}), flush=True)
+    elif records:
+        print_table(records)
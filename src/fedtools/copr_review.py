@@ -1,6 +1,5 @@
 from argparse import Namespace
 
-from copr.v3 import Client
 import os
 
 from fedtools.utils import create_copr_repo, copr_build, LOGGER
@@ -28,6 +27,8 @@ def build(args: Namespace):
         LOGGER.error("No command specified, use --help to see all options.")
         exit(1)
 
+    from copr.v3 import Client
+
     client = Client.create_from_config_file()
     if args.cleanup is True:
         cleanup_review_copr_repos(client)
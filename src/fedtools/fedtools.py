@@ -2,37 +2,190 @@
 
 import argcomplete
 import argparse
-from argparse import ArgumentParser
-from fedtools import check_upstream_versions
-from fedtools import build_srpm
-from fedtools import review
-from fedtools import fedorapeople
-from fedtools import copr_review
-from fedtools import post_rust_review
-from fedtools import copr_chain_build
+import importlib
+from argparse import ArgumentParser, Namespace
+from typing import Callable
+from fedtools import profiling
 
 
-def register_check_versions_command(parser: ArgumentParser):
+def lazy_command(module: str, function: str) -> Callable[[Namespace], None]:
+    """Return a command that imports its module only when it is executed
+
+    The command modules pull in heavy dependencies (copr, rpm, git, requests, ...).
+    Importing them lazily keeps `fedtools --help` and tab completion fast.
+
+    Parameters:
+        module: Name of the module in the fedtools package
+        function: Name of the function that implements the command
+
+    Returns: Function that takes the parsed arguments and runs the command
+    """
+
+    def command(args: Namespace):
+        return getattr(importlib.import_module(f"fedtools.{module}"), function)(args)
+
+    return command
+
+
+def add_package_lookup_arguments(parser: ArgumentParser):
     parser.add_argument(
         "--path",
         required=False,
         default="./",
         help="Path to parent directory of all package directories",
     )
-    parser.set_defaults(func=check_upstream_versions.check_versions)
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        required=False,
+        type=parse_positive_int,
+        default=None,
+        help="Number of packages that are looked up at the same time.\n"
+        "Defaults to 16.",
+    )
+    parser.add_argument(
+        "--spec-jobs",
+        required=False,
+        type=parse_positive_int,
+        default=None,
+        help="Number of spec files that are preprocessed and git repositories\n"
+        "that are checked at the same time. Defaults to the number of CPUs.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        required=False,
+        action="store_true",
+        help="Ignore cached data from previous runs.\n"
+        "The cache is refreshed with the results of this run.",
+    )
+
+
+def parse_positive_int(value: str) -> int:
+    """Parse a number of jobs, which must be at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a number")
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be at least 1")
+
+    return number
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    """Parse a shard in the format `i/n`"""
+    try:
+        shard, shard_count = map(int, value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not in the format i/n")
+    if not 1 <= shard <= shard_count:
+        raise argparse.ArgumentTypeError(f"shard must be between 1 and {shard_count}")
+
+    return shard, shard_count
+
+
+def register_check_versions_command(parser: ArgumentParser):
+    add_package_lookup_arguments(parser)
+    parser.add_argument(
+        "--format",
+        required=False,
+        choices=["table", "stream", "ndjson"],
+        default="table",
+        help="table: Print the sorted table after all packages were looked up\n"
+        "stream: Print every package as soon as it was looked up, followed by the sorted table\n"
+        "ndjson: Print every package as a JSON record as soon as it was looked up,\n"
+        'followed by a {"summary": {<status>: <count>}} record',
+    )
+    parser.add_argument(
+        "--shard",
+        required=False,
+        type=parse_shard,
+        default=None,
+        metavar="i/n",
+        help="Split the packages into n shards and only check the i-th shard.\n"
+        "Packages are assigned by a hash of their directory name, so every\n"
+        "machine computes the same shards.",
+    )
+    parser.add_argument(
+        "--output",
+        required=False,
+        default=None,
+        metavar="FILE",
+        help="Write the results as JSON to FILE, see --merge",
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--snapshot",
+        required=False,
+        action="store_true",
+        help="Print the latest results of `fedtools watch-versions` instead of\n"
+        "looking up the packages",
+    )
+    group.add_argument(
+        "--merge",
+        required=False,
+        nargs="+",
+        default=None,
+        metavar="FILE",
+        help="Print the results of multiple shards (written with --output)\n"
+        "as a single table instead of looking up the packages",
+    )
+    parser.set_defaults(func=lazy_command("check_upstream_versions", "check_versions"))
+
+
+def register_watch_versions_command(parser: ArgumentParser):
+    add_package_lookup_arguments(parser)
+    parser.set_defaults(func=lazy_command("watch_versions", "watch"))
 
 
 def register_build_srpm_command(parser: ArgumentParser):
-    parser.add_argument("specfile")
+    parser.add_argument(
+        "specfiles",
+        nargs="+",
+        metavar="specfile",
+        help="Spec files or package directories containing a spec file",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        required=False,
+        type=parse_positive_int,
+        default=None,
+        help="Number of packages whose SRPMs are built at the same time.\n"
+        "Defaults to 4.",
+    )
     parser.add_argument("--arch", required=False, default=None)
     parser.add_argument("--mock", required=False, action="store_true")
-    parser.set_defaults(func=build_srpm.build)
+    parser.add_argument(
+        "--chroot",
+        required=False,
+        action="append",
+        default=None,
+        help="Mock config (e.g. fedora-rawhide-aarch64) that is used with --mock.\n"
+        "Can be passed multiple times to build in multiple chroots at the same time.\n"
+        "Defaults to mock-root from the configuration file.",
+    )
+    parser.add_argument(
+        "--mock-jobs",
+        required=False,
+        type=parse_positive_int,
+        default=None,
+        help="Number of mock builds that run at the same time. Defaults to 2.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        required=False,
+        action="store_true",
+        help="Download all sources again instead of using the source cache.\n"
+        "The cache is refreshed with the downloaded sources.",
+    )
+    parser.set_defaults(func=lazy_command("build_srpm", "build"))
 
 
 def register_review_command(parser: ArgumentParser):
     parser.add_argument("bug")
     parser.add_argument("-y", required=False, action="store_true")
-    parser.set_defaults(func=review.make)
+    parser.set_defaults(func=lazy_command("review", "make"))
 
 
 def register_fedorapeople_upload(parser: ArgumentParser):
@@ -44,23 +197,26 @@ def register_fedorapeople_upload(parser: ArgumentParser):
         "should reside. Defaults to the current path",
     )
     parser.add_argument("--username", required=False, default=None)
-    parser.set_defaults(func=fedorapeople.upload)
+    parser.set_defaults(func=lazy_command("fedorapeople", "upload"))
 
 
 def register_copr_review_command(parser: ArgumentParser):
+    # copr_review only imports copr when a command is executed
+    from fedtools.copr_review import REVIEW_PREFIX
+
     group = parser.add_mutually_exclusive_group()
     group.add_argument("--srpm", help="Path to SRPM")
     group.add_argument(
         "--cleanup",
-        help=f"Delete all copr projects that have {copr_review.REVIEW_PREFIX} as a prefix",
+        help=f"Delete all copr projects that have {REVIEW_PREFIX} as a prefix",
         action="store_true",
     )
-    parser.set_defaults(func=copr_review.build)
+    parser.set_defaults(func=lazy_command("copr_review", "build"))
 
 
 def register_rust_review_command(parser: ArgumentParser):
     parser.add_argument("package_name", help="Name of the package")
-    parser.set_defaults(func=post_rust_review.make)
+    parser.set_defaults(func=lazy_command("post_rust_review", "make"))
 
 
 def register_copr_chain_build_command(parser: ArgumentParser):
@@ -74,7 +230,7 @@ def register_copr_chain_build_command(parser: ArgumentParser):
         action="store_true",
         help="Generate a fedpkg chain-build command instead of building in copr",
     )
-    parser.set_defaults(func=copr_chain_build.build)
+    parser.set_defaults(func=lazy_command("copr_chain_build", "build"))
 
 
 def main():
@@ -83,6 +239,19 @@ def main():
         description="Collection of python scripts that help with fedora packaging / maintanence tasks",
         formatter_class=argparse.RawTextHelpFormatter,
     )
+    parser.add_argument(
+        "--profile",
+        required=False,
+        action="store_true",
+        help="Print how much time was spent in subprocesses, HTTP requests\n"
+        "and copr uploads, grouped by command and host",
+    )
+    parser.add_argument(
+        "--trace",
+        required=False,
+        metavar="FILE",
+        help="Write the recorded timings as a Chrome trace (JSON) file",
+    )
     subparsers = parser.add_subparsers(dest="command", required=True)
     # Build SRPM
     register_build_srpm_command(
@@ -99,6 +268,15 @@ def main():
             help="Compare package version with the latest upstream release.",
         )
     )
+    # Keep checking rpm versions in the background
+    register_watch_versions_command(
+        subparsers.add_parser(
+            "watch-versions",
+            help="Keep checking the packages for new upstream releases.\n"
+            "Every package is checked again based on how often upstream releases.\n"
+            "The results can be printed with `fedtools check-versions --snapshot`.",
+        )
+    )
     # Download files that make package review easier
     register_review_command(
         subparsers.add_parser(
@@ -147,6 +325,8 @@ def main():
 
     argcomplete.autocomplete(parser)
     args = parser.parse_args()
+    if args.profile or args.trace:
+        profiling.enable(print_summary_at_exit=args.profile, trace_file=args.trace)
     args.func(args)
 
 
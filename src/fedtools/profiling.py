@@ -0,0 +1,126 @@
+import atexit
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Whether spans are recorded, this is set with `fedtools --profile / --trace`
+enabled = False
+# Recorded spans: (category, name, start in seconds, duration in seconds, thread id)
+spans: list[tuple[str, str, float, float, int]] = []
+spans_lock = threading.Lock()
+# Start of the profiling, used as the origin of the trace timestamps
+start_time = time.perf_counter()
+
+
+def enable(print_summary_at_exit: bool = True, trace_file: str | None = None):
+    """Start recording spans
+
+    Parameters:
+        print_summary_at_exit: Whether to print a summary to stderr when fedtools exits
+        trace_file: Path of a Chrome trace file (chrome://tracing, Perfetto) that
+                    will be written when fedtools exits
+    """
+    global enabled, start_time
+
+    enabled = True
+    start_time = time.perf_counter()
+    if print_summary_at_exit:
+        atexit.register(print_summary)
+    if trace_file is not None:
+        atexit.register(write_trace, trace_file)
+
+
+@contextmanager
+def span(category: str, name: str):
+    """Record how long the wrapped block takes
+
+    Parameters:
+        category: Kind of work, e.g. "subprocess" or "http"
+        name: What the work is grouped by in the summary, e.g. the command or the host
+    """
+    if not enabled:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        with spans_lock:
+            spans.append(
+                (category, name, start - start_time, duration, threading.get_ident())
+            )
+
+
+def summary() -> list[list]:
+    """Summarize the recorded spans grouped by category and name
+
+    Returns: Rows of category, name, count, total, mean and max seconds,
+             sorted by the total time
+    """
+    groups = {}
+    with spans_lock:
+        for category, name, _, duration, _ in spans:
+            groups.setdefault((category, name), []).append(duration)
+
+    rows = [
+        [
+            category,
+            name,
+            len(durations),
+            sum(durations),
+            sum(durations) / len(durations),
+            max(durations),
+        ]
+        for (category, name), durations in groups.items()
+    ]
+    rows.sort(key=lambda row: row[3], reverse=True)
+
+    return rows
+
+
+def print_summary():
+    """Print the timing summary to stderr"""
+    rows = summary()
+    if not rows:
+        return
+
+    name_width = max(len(f"{row[0]}: {row[1]}") for row in rows)
+    print(
+        f"\n{'Stage':<{name_width}}  {'Count':>6}  {'Total (s)':>10}  {'Mean (s)':>9}  {'Max (s)':>8}",
+        file=sys.stderr,
+    )
+    for category, name, count, total, mean, maximum in rows:
+        print(
+            f"{category + ': ' + name:<{name_width}}  {count:>6}  {total:>10.3f}  {mean:>9.3f}  {maximum:>8.3f}",
+            file=sys.stderr,
+        )
+    print(
+        f"Wall time: {time.perf_counter() - start_time:.3f}s",
+        file=sys.stderr,
+    )
+
+
+def write_trace(path: str):
+    """Write the recorded spans as a Chrome trace file"""
+    with spans_lock:
+        events = [
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": int(start * 1_000_000),
+                "dur": int(duration * 1_000_000),
+                "pid": os.getpid(),
+                "tid": thread_id,
+            }
+            for category, name, start, duration, thread_id in spans
+        ]
+
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
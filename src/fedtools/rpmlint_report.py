@@ -0,0 +1,201 @@
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+import tabulate
+from fedtools.cache import load_json_cache, write_file_atomically, write_json_cache
+from fedtools.utils import exec_cmd, Colors, LOGGER
+
+
+RPMLINT_CACHE_FILE = "rpmlint.json"
+# Findings look like "rust-foo+default-devel.noarch: W: no-documentation"
+FINDING = re.compile(
+    r"^(?P<package>\S+?):\s+(?P<severity>[EWI]):\s+(?P<check>\S+)\s*(?P<details>.*)$"
+)
+# rpmlint exits with these codes if it found errors / the badness threshold
+# was reached, which is a successful run for us
+RPMLINT_SUCCESS_CODES = (0, 64, 66)
+SEVERITY_ORDER = ["E", "W", "I"]
+SEVERITY_COLORS = {"E": Colors.RED, "W": Colors.YELLOW, "I": Colors.WHITE}
+
+
+def rpmlint_version() -> str:
+    result = exec_cmd(
+        "rpmlint",
+        ["--version"],
+        subprocess_arguments={"capture_output": True},
+        check_result=False,
+    )
+
+    return result.stdout.decode("utf-8").strip()
+
+
+def rpm_label(path: str) -> str:
+    """Return the name rpmlint prints for a RPM, e.g. "rust-foo-devel.noarch"
+
+    Parameters:
+        path: Path to a RPM whose file name follows name-version-release.arch.rpm
+    """
+    nvr, _, arch = os.path.basename(path).removesuffix(".rpm").rpartition(".")
+
+    return f"{nvr.rsplit('-', 2)[0]}.{arch}"
+
+
+def rpm_hash(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+
+def lint_batch(paths: list[str]) -> dict[str, list[dict]] | None:
+    """Run a single rpmlint process over multiple RPMs
+
+    Parameters:
+        paths: RPMs that are linted, their labels (see rpm_label) must be unique
+
+    Returns: Findings of every RPM or None if rpmlint failed
+    """
+    result = exec_cmd(
+        "rpmlint",
+        paths,
+        subprocess_arguments={"capture_output": True},
+        check_result=False,
+    )
+    if result.returncode not in RPMLINT_SUCCESS_CODES:
+        LOGGER.error(f"rpmlint failed:\n{result.stderr.decode('utf-8')}")
+        return None
+
+    labels = {rpm_label(path): path for path in paths}
+    findings = {path: [] for path in paths}
+    for line in result.stdout.decode("utf-8").split("\n"):
+        if (match := FINDING.match(line)) and match["package"] in labels:
+            findings[labels[match["package"]]].append(
+                {
+                    "severity": match["severity"],
+                    "check": match["check"],
+                    "details": match["details"],
+                }
+            )
+
+    return findings
+
+
+def batch_rpms(paths: list[str], jobs: int) -> list[list[str]]:
+    """Split RPMs into batches for rpmlint
+
+    rpmlint only prints the package name and architecture, so RPMs with the
+    same name and architecture (e.g. built in different chroots) must be
+    linted in different batches.
+
+    Parameters:
+        paths: RPMs that should be linted
+        jobs: Number of batches that should run at the same time
+
+    Returns: Batches of RPMs
+    """
+    # RPMs with unique labels
+    groups = []
+    for path in paths:
+        label = rpm_label(path)
+        for group in groups:
+            if label not in group:
+                group[label] = path
+                break
+        else:
+            groups.append({label: path})
+
+    # Split the groups, so all workers have something to do
+    batches = []
+    for group in groups:
+        group_paths = list(group.values())
+        count = min(jobs, len(group_paths))
+        batches.extend(group_paths[index::count] for index in range(count))
+
+    return batches
+
+
+def lint(paths: list[str], jobs: int | None = None) -> dict[str, list[dict]]:
+    """Lint RPMs with rpmlint
+
+    The findings are cached by the hash of the RPM and the rpmlint version,
+    so RPMs that did not change are not linted again.
+
+    Parameters:
+        paths: RPMs that should be linted
+        jobs: Number of rpmlint processes that run at the same time.
+              Defaults to the number of CPUs.
+
+    Returns: Findings of every RPM
+    """
+    version = rpmlint_version()
+    cache = load_json_cache(RPMLINT_CACHE_FILE)
+    keys = {
+        path: hashlib.sha256(f"{rpm_hash(path)}:{version}".encode("utf-8")).hexdigest()
+        for path in paths
+    }
+
+    findings = {path: cache[keys[path]] for path in paths if keys[path] in cache}
+    if uncached_paths := [path for path in paths if path not in findings]:
+        jobs = jobs or os.cpu_count()
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            for batch_findings in executor.map(
+                lint_batch, batch_rpms(uncached_paths, jobs)
+            ):
+                if batch_findings is None:
+                    continue
+                for path, rpm_findings in batch_findings.items():
+                    findings[path] = rpm_findings
+                    cache[keys[path]] = rpm_findings
+        write_json_cache(RPMLINT_CACHE_FILE, cache)
+
+    return findings
+
+
+def print_report(findings: dict[str, list[dict]]):
+    """Print the findings of all RPMs as a single table, sorted by severity"""
+    all_findings = sorted(
+        (
+            (finding, path)
+            for path, rpm_findings in findings.items()
+            for finding in rpm_findings
+        ),
+        key=lambda item: SEVERITY_ORDER.index(item[0]["severity"]),
+    )
+
+    if all_findings:
+        print(
+            tabulate.tabulate(
+                [
+                    [
+                        SEVERITY_COLORS[finding["severity"]] + value + Colors.RESET
+                        for value in (
+                            finding["severity"],
+                            os.path.basename(path),
+                            finding["check"],
+                            finding["details"],
+                        )
+                    ]
+                    for finding, path in all_findings
+                ],
+                headers=["Severity", "RPM", "Check", "Details"],
+                tablefmt="simple_grid",
+            )
+        )
+
+    counts = {
+        severity: sum(finding["severity"] == severity for finding, _ in all_findings)
+        for severity in SEVERITY_ORDER
+    }
+    LOGGER.info(
+        f"rpmlint: {len(findings)} RPMs checked, {counts['E']} errors, "
+        f"{counts['W']} warnings, {counts['I']} infos"
+    )
+
+
+def write_report(path: str, findings: dict[str, list[dict]]):
+    """Write the findings as JSON, keyed by the path of the RPM"""
+    write_file_atomically(path, json.dumps(findings, indent=2).encode("utf-8"))
@@ -0,0 +1,438 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+import requests
+from fedtools import profiling
+from fedtools.cache import cache_path, file_lock, load_json_cache, write_json_cache
+from fedtools.utils import exec_cmd, LOGGER
+
+
+# Index that maps source URLs to the hash of their content
+SOURCES_INDEX_FILE = os.path.join("sources", "index.json")
+# Serializes updates of the index between threads and fedtools processes
+SOURCES_INDEX_LOCK_FILE = os.path.join("sources", "index.lock")
+# Default maximum size of the source cache in MiB
+DEFAULT_SOURCE_CACHE_SIZE = 10 * 1024
+# Default number of sources that are downloaded at the same time
+DEFAULT_DOWNLOAD_JOBS = 8
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_TIMEOUT = 60
+# Number of times an interrupted download is resumed before giving up
+DOWNLOAD_ATTEMPTS = 5
+# Minimum number of seconds between two progress updates
+PROGRESS_INTERVAL = 0.2
+
+
+class SourceError(Exception):
+    """Sources of a spec file could not be listed or downloaded"""
+
+
+def run_spectool(arguments: list[str], error_msg: str) -> str:
+    """Run spectool and return its output
+
+    Raises: SourceError if spectool fails
+    """
+    result = exec_cmd(
+        "spectool",
+        arguments,
+        subprocess_arguments={"capture_output": True},
+        check_result=False,
+    )
+    if result.returncode != 0:
+        raise SourceError(f"{error_msg}: {result.stderr.decode('utf-8').strip()}")
+
+    return result.stdout.decode("utf-8")
+
+
+def source_file_name(url: str) -> str:
+    """Return the file name spectool / rpmbuild expect for a source URL
+
+    A "#/name" fragment overrides the file name of the URL, e.g.
+    https://github.com/o/p/archive/v1.0.tar.gz#/p-1.0.tar.gz
+    """
+    parsed_url = urlparse(url)
+    if parsed_url.fragment.startswith("/"):
+        return os.path.basename(parsed_url.fragment)
+
+    return os.path.basename(parsed_url.path)
+
+
+def list_sources(spec_path: str) -> list[str]:
+    """List the URLs of all remote sources and patches of a spec file
+
+    Parameters:
+        spec_path: Path to the spec file
+
+    Returns: Source URLs with all macros expanded
+
+    Raises: SourceError if spectool can't parse the spec file
+    """
+    output = run_spectool(
+        ["--list-files", spec_path], "spectool could not list the source files"
+    )
+
+    urls = []
+    for line in output.split("\n"):
+        # Lines look like "Source0: https://example.com/example-1.0.tar.gz"
+        _, _, value = line.partition(":")
+        if "://" in (value := value.strip()):
+            urls.append(value)
+
+    return urls
+
+
+def index_key(url: str) -> str:
+    """Return the key of a source URL in the index
+
+    The fragment is never sent to the server, so it does not change the content.
+    """
+    return urlparse(url)._replace(fragment="").geturl()
+
+
+def object_path(sha256: str) -> str:
+    """Return the path of a cached source file"""
+    return cache_path("sources", "objects", sha256[:2], sha256)
+
+
+def cached_object(url: str) -> str | None:
+    """Return the path of the cached content of `url` or None if it is not cached"""
+    entry = load_json_cache(SOURCES_INDEX_FILE).get(index_key(url))
+    if entry is None or not os.path.exists(path := object_path(entry["sha256"])):
+        return None
+
+    # The modification time is used to evict the least recently used sources
+    os.utime(path)
+
+    return path
+
+
+class DownloadProgress:
+    """Aggregated progress of concurrent downloads
+
+    On a terminal the progress of all downloads is shown in a single line,
+    otherwise every finished download is logged.
+    """
+
+    def __init__(self, count: int, interactive: bool = True):
+        """
+        Parameters:
+            count: Number of files that will be downloaded
+            interactive: Whether the progress line should be shown on a terminal
+        """
+        self.count = count
+        self.finished = 0
+        self.sizes = {}
+        self.downloaded = {}
+        self.lock = threading.Lock()
+        self.interactive = interactive and sys.stderr.isatty()
+        self.last_print = 0.0
+
+    def start(self, url: str, offset: int, size: int | None):
+        """Register a (resumed) download of `size` bytes that starts at `offset`"""
+        with self.lock:
+            self.downloaded[url] = offset
+            self.sizes[url] = size
+            self.__print()
+
+    def advance(self, url: str, length: int):
+        with self.lock:
+            self.downloaded[url] += length
+            self.__print()
+
+    def finish(self, url: str):
+        with self.lock:
+            self.finished += 1
+            if not self.interactive:
+                LOGGER.info(f"Downloaded {url} ({self.finished}/{self.count})")
+            self.__print(force=True)
+
+    def close(self):
+        if self.interactive and self.count:
+            print(file=sys.stderr)
+
+    def __print(self, force: bool = False):
+        if not self.interactive or (
+            not force and time.monotonic() - self.last_print < PROGRESS_INTERVAL
+        ):
+            return
+
+        self.last_print = time.monotonic()
+        downloaded = sum(self.downloaded.values()) / 1024 / 1024
+        total = sum(size for size in self.sizes.values() if size) / 1024 / 1024
+        print(
+            f"\rDownloading sources: {self.finished}/{self.count} files, "
+            f"{downloaded:.1f}/{total:.1f} MiB",
+            end="",
+            file=sys.stderr,
+            flush=True,
+        )
+
+
+def download_part(
+    session: requests.Session,
+    url: str,
+    part_path: str,
+    validator_path: str,
+    progress: DownloadProgress,
+):
+    """Download `url` into `part_path`, continuing a previous partial download
+
+    A partial download is only continued if the server confirms with If-Range
+    that the file has not changed since, otherwise it starts from zero.
+    """
+    # Range offsets and Content-Length refer to the encoded body, so the
+    # server must not compress the (usually already compressed) sources
+    headers = {"Accept-Encoding": "identity"}
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    validator = None
+    if os.path.exists(validator_path):
+        with open(validator_path, "r") as f:
+            validator = f.read()
+    if offset and validator:
+        headers |= {"Range": f"bytes={offset}-", "If-Range": validator}
+    else:
+        offset = 0
+
+    with session.get(
+        url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT
+    ) as response:
+        # The partial file already contains the whole file
+        if response.status_code == 416 and offset:
+            return
+        response.raise_for_status()
+        # The server sent the whole file, because it changed or does not support ranges
+        if response.status_code != 206:
+            offset = 0
+            # Weak ETags can't be used with If-Range
+            validator = response.headers.get("ETag", "")
+            if validator.startswith("W/") or not validator:
+                validator = response.headers.get("Last-Modified", "")
+            with open(validator_path, "w") as f:
+                f.write(validator)
+
+        length = response.headers.get("Content-Length")
+        progress.start(url, offset, offset + int(length) if length else None)
+        with open(part_path, "ab" if offset else "wb") as f:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                progress.advance(url, len(chunk))
+
+
+def download_object(
+    session: requests.Session, url: str, progress: DownloadProgress
+) -> str:
+    """Download `url` into the source cache
+
+    Interrupted downloads are resumed, both within a run and across runs.
+    Concurrent downloads of the same URL (e.g. a source that is shared by
+    multiple packages) are serialized, the later ones use the cached result.
+
+    Parameters:
+        session: Session that is used for the requests
+        url: URL of the source
+        progress: Progress of all downloads of this run
+
+    Returns: Path of the cached source file
+    """
+    partial_path = cache_path(
+        "sources",
+        "partial",
+        hashlib.sha256(index_key(url).encode("utf-8")).hexdigest(),
+    )
+    part_path = f"{partial_path}.part"
+    validator_path = f"{partial_path}.validator"
+
+    with file_lock(f"{partial_path}.lock") as waited:
+        # Somebody else downloaded the same URL while we were waiting
+        if waited and (path := cached_object(url)) is not None:
+            progress.finish(url)
+            return path
+
+        with profiling.span("download", urlparse(url).netloc):
+            for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+                try:
+                    download_part(session, url, part_path, validator_path, progress)
+                    break
+                except requests.HTTPError:
+                    # The server answered, trying again won't help
+                    raise
+                except (OSError, requests.RequestException) as e:
+                    if attempt == DOWNLOAD_ATTEMPTS:
+                        raise
+                    LOGGER.warning(
+                        f"Download of {url} was interrupted, resuming: {e}"
+                    )
+        progress.finish(url)
+
+        sha256 = hashlib.sha256()
+        with open(part_path, "rb") as f:
+            while chunk := f.read(DOWNLOAD_CHUNK_SIZE):
+                sha256.update(chunk)
+
+        path = object_path(sha256.hexdigest())
+        if os.path.exists(path):
+            # The same content is already cached under a different URL
+            os.remove(part_path)
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Cached files are shared between all working directories via hardlinks,
+            # so they must not be modified in place
+            os.chmod(part_path, 0o444)
+            os.replace(part_path, path)
+        os.remove(validator_path)
+
+        with file_lock(cache_path(SOURCES_INDEX_LOCK_FILE)):
+            index = load_json_cache(SOURCES_INDEX_FILE)
+            index[index_key(url)] = {"sha256": sha256.hexdigest()}
+            write_json_cache(SOURCES_INDEX_FILE, index)
+
+        return path
+
+
+def link_object(path: str, destination: str):
+    """Hardlink a cached source file to `destination`
+
+    If the cache and the destination are on different file systems, the file is
+    copied instead, which is a cheap reflink on btrfs / XFS.
+    """
+    try:
+        os.link(path, destination)
+    except OSError:
+        result = exec_cmd(
+            "cp",
+            ["--reflink=auto", path, destination],
+            subprocess_arguments={"capture_output": True},
+            check_result=False,
+        )
+        if result.returncode != 0:
+            raise SourceError(
+                f"Could not copy {path} to {destination}: "
+                + result.stderr.decode("utf-8").strip()
+            )
+
+
+def fetch_sources(
+    spec_path: str,
+    directory: str,
+    use_cache: bool = True,
+    jobs: int = DEFAULT_DOWNLOAD_JOBS,
+    show_progress: bool = True,
+):
+    """Place all remote sources of a spec file in `directory` using the source cache
+
+    Sources that are not cached are downloaded at the same time.
+    Existing files in `directory` are not downloaded again, just like spectool does.
+    Sources that are not served over HTTP(S) (e.g. ftp://) are not cached
+    and are downloaded with spectool instead.
+
+    Parameters:
+        spec_path: Path to the spec file
+        directory: Directory where the sources should be placed
+        use_cache: Whether already cached sources may be used.
+                   The cache is updated in both cases.
+        jobs: Number of sources that are downloaded at the same time
+        show_progress: Whether to show the download progress on the terminal.
+                       Otherwise only finished downloads are logged.
+
+    Raises: SourceError if a source could not be downloaded
+    """
+    uncached_sources = False
+    # Missing sources grouped by their content, the same file may be used
+    # multiple times with different names
+    missing_sources = {}
+    for url in list_sources(spec_path):
+        if urlparse(url).scheme not in ("http", "https"):
+            uncached_sources = True
+        elif not os.path.exists(os.path.join(directory, source_file_name(url))):
+            missing_sources.setdefault(index_key(url), []).append(url)
+
+    paths = {}
+    downloads = []
+    for key, urls in missing_sources.items():
+        if use_cache and (path := cached_object(urls[0])) is not None:
+            paths[key] = path
+        else:
+            downloads.append(key)
+
+    if downloads:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=jobs, pool_maxsize=jobs)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        progress = DownloadProgress(len(downloads), show_progress)
+        failed = []
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = {
+                executor.submit(download_object, session, key, progress): key
+                for key in downloads
+            }
+            for future in as_completed(futures):
+                try:
+                    paths[futures[future]] = future.result()
+                except (OSError, requests.RequestException) as e:
+                    LOGGER.error(f"Could not download {futures[future]}: {e}")
+                    failed.append(futures[future])
+        progress.close()
+        if failed:
+            raise SourceError(f"Could not download {', '.join(failed)}")
+
+    for key, urls in missing_sources.items():
+        for url in urls:
+            destination = os.path.join(directory, source_file_name(url))
+            if not os.path.exists(destination):
+                link_object(paths[key], destination)
+
+    if uncached_sources:
+        run_spectool(
+            ["--get-files", "--directory", directory, spec_path],
+            "spectool could not download the source files",
+        )
+
+
+def evict(max_size: int):
+    """Remove the least recently used sources until the cache is smaller than `max_size`
+
+    Parameters:
+        max_size: Maximum size of the cache in MiB
+    """
+    directory = cache_path("sources", "objects")
+    objects = []
+    for root, _, files in os.walk(directory):
+        for name in files:
+            # Skip downloads that are still in progress
+            if name.startswith("."):
+                continue
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            objects.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+
+    size = sum(object_size for _, object_size, _ in objects)
+    evicted = set()
+    for _, object_size, path in sorted(objects):
+        if size <= max_size * 1024 * 1024:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        size -= object_size
+        evicted.add(os.path.basename(path))
+
+    if evicted:
+        with file_lock(cache_path(SOURCES_INDEX_LOCK_FILE)):
+            index = load_json_cache(SOURCES_INDEX_FILE)
+            write_json_cache(
+                SOURCES_INDEX_FILE,
+                {
+                    url: entry
+                    for url, entry in index.items()
+                    if entry["sha256"] not in evicted
+                },
+            )
@@ -1,19 +1,25 @@
 import subprocess
 import sys
+import threading
+from collections import deque
 from subprocess import CompletedProcess
-from typing import Callable
-
-from copr.v3 import Client
-from copr.v3.exceptions import CoprException, CoprNoResultException
-import rpm
+from typing import Callable, IO, TYPE_CHECKING
 
 import logging
 
+from fedtools import profiling
+
+if TYPE_CHECKING:
+    from copr.v3 import Client
+
 
 logging.basicConfig(format="%(message)s")
 LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.INFO)
 
+# Number of lines per output stream that are kept by `exec_cmd(stream=True)`
+DEFAULT_OUTPUT_LINES = 200
+
 
 class Colors:
     RED = "\033[91m"
@@ -33,6 +39,73 @@ def __pretty_print_subprocess_result(msg, result):
     LOGGER.info("-----------------------------------------------------")
 
 
+def __read_output(
+    name: str,
+    pipe: IO[bytes],
+    lines: deque,
+    tail_output: IO[bytes] | None,
+    output_callback: Callable[[str, str], None] | None,
+):
+    """Read the output of a process line by line (see `exec_cmd(stream=True)`)"""
+    for line in iter(pipe.readline, b""):
+        lines.append(line)
+        if tail_output is not None:
+            tail_output.write(line)
+            tail_output.flush()
+        if output_callback is not None:
+            output_callback(name, line.decode("utf-8", errors="replace"))
+    pipe.close()
+
+
+def __stream_cmd(
+    final_cmd: list[str],
+    subprocess_arguments: dict,
+    tail_command: bool,
+    output_callback: Callable[[str, str], None] | None,
+    output_lines: int,
+) -> CompletedProcess:
+    """Execute a command and stream its output (see `exec_cmd(stream=True)`)"""
+    process = subprocess.Popen(
+        final_cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **subprocess_arguments,
+    )
+    outputs = {"stdout": deque(maxlen=output_lines), "stderr": deque(maxlen=output_lines)}
+    # stdout and stderr are read at the same time, so the process never blocks
+    # on a full pipe
+    readers = [
+        threading.Thread(
+            target=__read_output,
+            args=(
+                name,
+                getattr(process, name),
+                outputs[name],
+                getattr(sys, name).buffer if tail_command is True else None,
+                output_callback,
+            ),
+            daemon=True,
+        )
+        for name in outputs
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        returncode = process.wait()
+    except KeyboardInterrupt:
+        process.kill()
+        raise
+    for reader in readers:
+        reader.join()
+
+    return CompletedProcess(
+        final_cmd,
+        returncode,
+        stdout=b"".join(outputs["stdout"]),
+        stderr=b"".join(outputs["stderr"]),
+    )
+
+
 def exec_cmd(
     cmd: str,
     cmd_arguments: list[str],
@@ -40,6 +113,9 @@ def exec_cmd(
     tail_command: bool = False,
     check_result: bool = True,
     error_msg: str = "",
+    stream: bool = False,
+    output_callback: Callable[[str, str], None] | None = None,
+    output_lines: int = DEFAULT_OUTPUT_LINES,
 ) -> CompletedProcess:
     """Execute a command with subprocess.
 
@@ -48,13 +124,24 @@ def exec_cmd(
         cmd_arguments: Arguments that will be passed with the command.
         subprocess_arguments: Arguments that are specific to subprocess.
         tail_command: Whether to print the command stdout and stderr to the command line.
-                      If this is set to True then `check_result` is ignored.
+                      If this is set to True then `check_result` is ignored,
+                      unless `stream` is set to True.
         check_result: Whether to check the result of the executed command or not.
                       This will exit the program if it is set to True and the return
                       code of the command is unequal to 0.
                       This argument will be ignored if `tail_command` is set to True.
         error_msg: Error message if the executed command fails.
                    This will be used when `check_result` is set to True.
+        stream: Whether to read stdout and stderr line by line while the command runs,
+                instead of buffering the whole output. Every line is printed to the
+                command line (if `tail_command` is set to True) and passed to
+                `output_callback`. Only the last `output_lines` lines of stdout and
+                stderr are kept in the result, so long running commands use
+                constant memory.
+        output_callback: Function that is called with the name of the stream
+                         ("stdout" or "stderr") and every line of output.
+                         Only used if `stream` is set to True.
+        output_lines: Number of lines per stream that are kept if `stream` is set to True.
 
     Returns: Returns result if the process could be completed successfully. Otherwise
              this function will exit with exit code 1 and print the defined error message.
@@ -69,6 +156,28 @@ def exec_cmd(
     final_cmd = [cmd]
     final_cmd.extend(cmd_arguments)
 
+    if stream is True:
+        try:
+            with profiling.span("subprocess", cmd):
+                result = __stream_cmd(
+                    final_cmd,
+                    subprocess_arguments,
+                    tail_command,
+                    output_callback,
+                    output_lines,
+                )
+        except KeyboardInterrupt:
+            LOGGER.error("\nStopping command execution")
+            exit(1)
+
+        if check_result is True and result.returncode != 0:
+            __pretty_print_subprocess_result(
+                f"{error_msg}\n(Last {output_lines} lines of output)", result
+            )
+            exit(1)
+
+        return result
+
     # Build the subprocess arguments that should be passed
     if tail_command is True:
         subprocess_arguments["stdout"] = sys.stdout
@@ -78,7 +187,8 @@ def exec_cmd(
 
     try:
         # Execute command with the defined options
-        result = subprocess.run(final_cmd, **subprocess_arguments)
+        with profiling.span("subprocess", cmd):
+            result = subprocess.run(final_cmd, **subprocess_arguments)
     except KeyboardInterrupt:
         LOGGER.error("\nStopping command execution")
         exit(1)
@@ -126,7 +236,7 @@ def search_for_dict_in_list_of_dicts_and_get_value(
 
 
 def create_copr_repo(
-    client: Client,
+    client: "Client",
     project_name: str,
     chroots: list[str] = ["fedora-rawhide-x86_64"],
     additional_options: dict = {},
@@ -139,6 +249,7 @@ def create_copr_repo(
         chroots: The chroots that the repository should have activated
         additional_options: Additional options that should be activated for the copr repostiory
     """
+    from copr.v3.exceptions import CoprException, CoprNoResultException
 
     try:
         client.project_proxy.get(client.base_proxy.auth_username(), project_name)
@@ -155,7 +266,7 @@ def create_copr_repo(
 
 
 def copr_build(
-    client: Client, project_name: str, srpm_path: str, buildopts: dict = {}
+    client: "Client", project_name: str, srpm_path: str, buildopts: dict = {}
 ) -> int:
     """Start a copr build
 
@@ -167,9 +278,10 @@ def copr_build(
     """
     LOGGER.info(f"Building {srpm_path} in {project_name}")
     # https://python-copr.readthedocs.io/en/latest/ClientV3.html
-    build = client.build_proxy.create_from_file(
-        client.base_proxy.auth_username(), project_name, srpm_path, buildopts=buildopts
-    )
+    with profiling.span("copr", "upload"):
+        build = client.build_proxy.create_from_file(
+            client.base_proxy.auth_username(), project_name, srpm_path, buildopts=buildopts
+        )
     return build.id
 
 
@@ -179,6 +291,8 @@ def package_name_from_srpm(path: str) -> str:
     Parameters:
         path: Path to a SRPM file
     """
+    import rpm
+
     package_name = None
     with open(path, "rb") as f:
         try:
@@ -0,0 +1,190 @@
+import os
+import time
+from argparse import Namespace
+from fedtools import check_upstream_versions
+from fedtools.cache import load_json_cache, write_json_cache
+from fedtools.config import Config
+from fedtools.utils import LOGGER
+
+
+# Bounds for the time between two upstream checks of a package (in seconds)
+DEFAULT_MIN_INTERVAL = 60 * 60
+DEFAULT_MAX_INTERVAL = 7 * 24 * 60 * 60
+# A package is checked again after this fraction of its expected release interval
+REFRESH_FACTOR = 0.25
+# Seconds between two scans of the spec files
+DEFAULT_RESCAN_INTERVAL = 10 * 60
+# Number of observed releases that are kept per package
+MAX_CHANGES = 10
+
+
+def next_check_interval(state: dict, now: float, config: dict) -> float:
+    """Compute the number of seconds until a package should be checked again
+
+    The expected release interval is the average time between the observed
+    releases. If less than two releases were observed, the time since the last
+    release (or since the package was first seen) is used instead.
+    Packages that release often are checked often, packages that release once
+    a year are checked rarely.
+
+    Parameters:
+        state: Watch state of the package
+        now: Current time
+        config: Configuration of the check-versions command
+
+    Returns: Seconds until the next check
+    """
+    changes = state.get("changes", [])
+    if len(changes) >= 2:
+        expected_interval = (changes[-1] - changes[0]) / (len(changes) - 1)
+    else:
+        expected_interval = now - (changes[-1] if changes else state["first_seen"])
+
+    return min(
+        max(
+            expected_interval * REFRESH_FACTOR,
+            config.get("watch-min-interval", DEFAULT_MIN_INTERVAL),
+        ),
+        config.get("watch-max-interval", DEFAULT_MAX_INTERVAL),
+    )
+
+
+def scan_packages(args: Namespace, states: dict) -> list[dict]:
+    """Gather the packages in `args.path` and merge them into the watch states
+
+    Parameters:
+        args: Arguments of the watch-versions command
+        states: Watch states of all packages, keyed by the package directory
+
+    Returns: The currently existing packages
+    """
+    packages = check_upstream_versions.gather_package_information(
+        args.path, args.spec_jobs, use_cache=not args.no_cache
+    )
+    check_upstream_versions.collect_git_dirty_states(packages, args.spec_jobs)
+
+    now = time.time()
+    for package in packages:
+        state = states.setdefault(
+            package["git_path"], {"first_seen": now, "next_check": now, "changes": []}
+        )
+        # The package was updated locally, its status has to be recomputed
+        if state.get("version") != package["version"]:
+            state["next_check"] = min(state["next_check"], now)
+        state["version"] = package["version"]
+        package["latest_version"] = state.get("latest_version")
+
+    # Forget packages that were removed
+    existing = {package["git_path"] for package in packages}
+    for git_path in list(states):
+        if git_path not in existing:
+            del states[git_path]
+
+    return packages
+
+
+def write_snapshot(path: str, packages: list[dict], states: dict, config: dict):
+    """Write the current results so `fedtools check-versions --snapshot` can read them"""
+    version_prefixes = config.get("version-prefix", [])
+    write_json_cache(
+        check_upstream_versions.SNAPSHOT_FILE,
+        {
+            "updated_at": time.time(),
+            "path": os.path.abspath(path),
+            "packages": {
+                package["git_path"]: check_upstream_versions.package_record(
+                    package, version_prefixes
+                )
+                for package in packages
+            },
+            "states": states,
+        },
+    )
+
+
+def watch(args: Namespace):
+    config = Config().command_config("check-versions")
+    jobs = args.jobs or check_upstream_versions.DEFAULT_JOBS
+    check_upstream_versions.setup_upstream_lookups(
+        config, jobs, use_cache=not args.no_cache
+    )
+    # Continue with the schedule of a previous run
+    snapshot = load_json_cache(check_upstream_versions.SNAPSHOT_FILE)
+    states = (
+        snapshot.get("states", {})
+        if snapshot.get("path") == os.path.abspath(args.path)
+        else {}
+    )
+    packages = []
+    next_scan = 0
+
+    LOGGER.info(f"Watching {os.path.abspath(args.path)}")
+    try:
+        while True:
+            now = time.time()
+            if now >= next_scan:
+                packages = scan_packages(args, states)
+                next_scan = now + config.get(
+                    "watch-rescan-interval", DEFAULT_RESCAN_INTERVAL
+                )
+                check_upstream_versions.http_cache.evict(
+                    config.get(
+                        "http-cache-max-age",
+                        check_upstream_versions.DEFAULT_HTTP_CACHE_MAX_AGE,
+                    )
+                )
+                write_snapshot(args.path, packages, states, config)
+
+            due = [
+                package
+                for package in packages
+                if states[package["git_path"]]["next_check"] <= now
+            ]
+            if due:
+                LOGGER.info(f"Checking {len(due)} package(s)")
+                try:
+                    check_upstream_versions.prefetch_upstream_versions(
+                        due, config, jobs
+                    )
+                except Exception as e:
+                    # The packages are still looked up one by one
+                    LOGGER.error(f"Could not prefetch upstream versions: {e!r}")
+                # A failing package must not stop the watcher, it is handled
+                # like a lookup without a result and checked again later
+                for _, package, latest_version in (
+                    check_upstream_versions.lookup_latest_versions(
+                        due, config, jobs, ignore_errors=True
+                    )
+                ):
+                    now = time.time()
+                    state = states[package["git_path"]]
+                    # Failed lookups don't count as a new release
+                    if latest_version is not None:
+                        if (
+                            state.get("latest_version") is not None
+                            and state["latest_version"] != latest_version
+                        ):
+                            state["changes"] = (state["changes"] + [now])[
+                                -MAX_CHANGES:
+                            ]
+                        state["latest_version"] = latest_version
+                        package["latest_version"] = latest_version
+                    state["last_checked"] = now
+                    state["next_check"] = now + next_check_interval(
+                        state, now, config
+                    )
+                write_json_cache(
+                    check_upstream_versions.GITLAB_PROJECTS_CACHE_FILE,
+                    check_upstream_versions.gitlab_project_ids,
+                )
+                write_snapshot(args.path, packages, states, config)
+
+            # Sleep until the next package is due or the spec files are scanned again
+            wake_up = min(
+                [next_scan]
+                + [states[package["git_path"]]["next_check"] for package in packages]
+            )
+            time.sleep(max(1, wake_up - time.time()))
+    except KeyboardInterrupt:
+        LOGGER.info("\nStopping watch")
+        write_snapshot(args.path, packages, states, config)
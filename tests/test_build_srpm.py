@@ -0,0 +1,27 @@
+import pytest
+from fedtools.build_srpm import pop_argument
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [
+        ["--enable-network", "--rootdir", "/x", "--no-cleanup-after"],
+        ["--enable-network", "--rootdir=/x", "--no-cleanup-after"],
+        ["--rootdir", "/y", "--enable-network", "--rootdir=/x", "--no-cleanup-after"],
+    ],
+)
+def test_pop_argument(arguments):
+    assert pop_argument(arguments, "--rootdir") == "/x"
+    assert arguments == ["--enable-network", "--no-cleanup-after"]
+
+
+def test_pop_missing_argument():
+    arguments = ["--enable-network"]
+
+    assert pop_argument(arguments, "--rootdir") is None
+    assert arguments == ["--enable-network"]
+
+
+def test_pop_argument_without_value():
+    with pytest.raises(SystemExit):
+        pop_argument(["--enable-network", "--rootdir"], "--rootdir")
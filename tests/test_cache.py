@@ -0,0 +1,50 @@
+import os
+import requests
+from fedtools import cache
+
+
+def response(content: bytes) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = requests.structures.CaseInsensitiveDict({"ETag": '"v1"'})
+    response._content = content
+    return response
+
+
+def age_files(directory: str, seconds: int):
+    """Move the modification time of all cache files back by `seconds`"""
+    for root, _, files in os.walk(directory):
+        for name in files:
+            path = os.path.join(root, name)
+            mtime = os.stat(path).st_mtime - seconds
+            os.utime(path, (mtime, mtime))
+
+
+def test_http_cache_evicts_unused_entries(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, "FEDTOOLS_CACHE_DIR", str(tmp_path))
+    http_cache = cache.HttpCache(ttl=60)
+    http_cache.store("https://example.com/old", response(b"old"))
+    http_cache.store("https://example.com/revalidated", response(b"revalidated"))
+    age_files(http_cache.directory, 7200)
+    entry = http_cache.load("https://example.com/revalidated")
+    http_cache.refresh("https://example.com/revalidated", entry, response(b""))
+    http_cache.store("https://example.com/new", response(b"new"))
+
+    http_cache.evict(3600)
+
+    assert http_cache.load("https://example.com/old") is None
+    assert http_cache.load("https://example.com/revalidated")["content"] == b"revalidated"
+    assert http_cache.load("https://example.com/new")["content"] == b"new"
+    files = [name for _, _, names in os.walk(http_cache.directory) for name in names]
+    assert len(files) == 4
+
+
+def test_http_cache_keeps_fresh_entries(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, "FEDTOOLS_CACHE_DIR", str(tmp_path))
+    http_cache = cache.HttpCache(ttl=86400)
+    http_cache.store("https://example.com/fresh", response(b"fresh"))
+    age_files(http_cache.directory, 7200)
+
+    http_cache.evict(3600)
+
+    assert http_cache.load("https://example.com/fresh")["content"] == b"fresh"
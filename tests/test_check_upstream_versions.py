@@ -0,0 +1,243 @@
+import json
+import time
+import requests
+import pytest
+from fedtools import check_upstream_versions
+from fedtools.check_upstream_versions import RateLimitExceeded, RateLimitScheduler
+
+
+NOW = 1_000_000.0
+HOST = "api.github.com"
+
+
+def rate_limit_response(limit: int, remaining: int, reset: float) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response.headers = requests.structures.CaseInsensitiveDict(
+        {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Remaining": str(remaining),
+            "X-RateLimit-Reset": str(int(reset)),
+        }
+    )
+    return response
+
+
+class Clock:
+    def __init__(self):
+        self.now = NOW
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(check_upstream_versions.time, "time", clock.time)
+    monkeypatch.setattr(check_upstream_versions.time, "sleep", lambda seconds: None)
+    return clock
+
+
+def test_deferred_requests_do_not_use_up_the_budget(clock):
+    scheduler = RateLimitScheduler()
+    # 400 of 5000 requests left, the budget resets in 600 seconds,
+    # so there is one slot every 1.5 seconds
+    scheduler.after_response(HOST, rate_limit_response(5000, 400, NOW + 600))
+
+    sent = 0
+    deferred = []
+    for _ in range(40):
+        try:
+            scheduler.before_request(HOST)
+            sent += 1
+        except RateLimitExceeded as e:
+            deferred.append(e.reset)
+
+    # Slots at +0, +1.5, ..., +9 are within the maximum pacing delay
+    assert sent == 7
+    assert len(deferred) == 33
+    # Every deferred request is retried at the same next free slot
+    next_slot = scheduler.blocked_until(HOST)
+    assert next_slot == pytest.approx(NOW + 10.5, abs=0.1)
+    assert set(deferred) == {next_slot}
+
+    # 393 requests are left for the remaining 589.5 seconds, deferred
+    # requests would have left only 360
+    clock.now = next_slot
+    scheduler.before_request(HOST)
+    assert scheduler.blocked_until(HOST) - next_slot == pytest.approx(
+        (NOW + 600 - next_slot) / (400 - 7)
+    )
+
+
+def test_exhausted_budget_blocks_until_the_reset(clock):
+    scheduler = RateLimitScheduler()
+    scheduler.after_response(HOST, rate_limit_response(5000, 0, NOW + 600))
+
+    with pytest.raises(RateLimitExceeded) as error:
+        scheduler.before_request(HOST)
+
+    assert error.value.reset == NOW + 600
+    assert scheduler.blocked_until(HOST) == NOW + 600
+
+
+def test_deferred_packages_are_reported_with_the_reset_time(
+    clock, monkeypatch, caplog
+):
+    scheduler = RateLimitScheduler()
+    scheduler.after_response(HOST, rate_limit_response(5000, 0, NOW + 600))
+    monkeypatch.setattr(check_upstream_versions, "rate_limit_scheduler", scheduler)
+    monkeypatch.setattr(
+        check_upstream_versions,
+        "get_latest_package_version",
+        lambda package, config: scheduler.before_request(HOST),
+    )
+    packages = [{"name": "rust-foo"}, {"name": "rust-bar"}]
+
+    results = list(
+        check_upstream_versions.lookup_latest_versions(
+            packages, {"rate-limit-max-wait": 0}, 2
+        )
+    )
+
+    assert sorted(results, key=lambda result: result[0]) == [
+        (0, packages[0], None),
+        (1, packages[1], None),
+    ]
+    reset = time.strftime("%H:%M:%S", time.localtime(NOW + 600))
+    assert f"Rate limit of {HOST} exceeded until {reset}" in caplog.text
+
+
+def test_requests_are_not_paced_with_enough_budget(clock):
+    scheduler = RateLimitScheduler()
+    scheduler.after_response(HOST, rate_limit_response(5000, 4000, NOW + 600))
+
+    for _ in range(100):
+        scheduler.before_request(HOST)
+
+    assert scheduler.blocked_until(HOST) == 0
+
+
+def graphql_tags_response(tags: list[str], end_cursor: str | None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    refs = {
+        "nodes": [{"name": tag} for tag in tags],
+        "pageInfo": {"hasNextPage": end_cursor is not None, "endCursor": end_cursor},
+    }
+    response._content = json.dumps({"data": {"repository": {"refs": refs}}}).encode()
+    return response
+
+
+def test_github_tags_after_the_prefetched_page_are_fetched_with_graphql(monkeypatch):
+    project = ("org", "project")
+    monkeypatch.setattr(
+        check_upstream_versions,
+        "github_tags",
+        {project: ([f"v2.{minor}" for minor in range(100)], "cursor-1")},
+    )
+    queries = []
+
+    def http_post(url, data, headers=None):
+        queries.append(data["query"])
+        return graphql_tags_response(["v1.0"], None)
+
+    monkeypatch.setattr(check_upstream_versions, "http_post", http_post)
+    monkeypatch.setattr(check_upstream_versions, "http_get", None)
+
+    pages = list(
+        check_upstream_versions.iter_github_graphql_tag_pages(project, 5, {})
+    )
+
+    assert pages[1:] == [["v1.0"]]
+    assert len(queries) == 1
+    assert 'after: "cursor-1"' in queries[0]
+
+
+def anitya_response(total_items: int, items: list[dict]) -> requests.Response:
+    response = requests.Response()
+    response.status_code = 200
+    response._content = json.dumps({"total_items": total_items, "items": items}).encode()
+    return response
+
+
+@pytest.mark.parametrize(
+    "package_count, expected_queries",
+    [
+        # Fewer packages than pages, the missing packages are queried by name
+        (3, ["page=1", "name=rust-pkg1", "name=rust-pkg2"]),
+        # More packages than pages, all pages are listed
+        (20, ["page=1"] + [f"page={page}" for page in range(2, 11)]),
+    ],
+)
+def test_anitya_packages_are_queried_by_name_for_small_trees(
+    monkeypatch, package_count, expected_queries
+):
+    packages = [{"name": f"rust-pkg{index}"} for index in range(package_count)]
+    queries = []
+
+    def http_get(url, headers=None):
+        query = url.split("&items_per_page=250&")[1]
+        queries.append(query)
+        # 10 pages, the first one contains rust-pkg0
+        items = [{"name": "rust-pkg0", "project": "pkg0", "version": "1.0"}]
+        return anitya_response(2500, items if query == "page=1" else [])
+
+    monkeypatch.setattr(check_upstream_versions, "http_get", http_get)
+
+    versions = check_upstream_versions.prefetch_anitya_versions(packages, 1)
+
+    assert queries == expected_queries
+    assert versions == {"rust-pkg0": ("pkg0", "1.0")}
+
+
+@pytest.mark.parametrize(
+    "older, newer",
+    [
+        ("1.9", "1.10"),
+        ("v1.2", "release-1.3"),
+        ("1.0~rc1", "1.0"),
+        ("1.0-rc1", "1.0"),
+        ("1.0.0-beta.2", "1.0.0"),
+        ("1.0.0-alpha", "1.0.0-beta"),
+        ("1.0a1", "1.0"),
+        ("1.0b1", "1.0b2"),
+        ("1.0", "1.0b"),
+        ("OpenSSL_1_1_1", "OpenSSL_1_1_1a"),
+        ("1.1.1a", "1.1.1b"),
+        ("1.0", "1.0.1"),
+    ],
+)
+def test_version_key_order(older, newer):
+    version_key = check_upstream_versions.version_key
+    assert version_key(older) < version_key(newer)
+
+
+def test_version_key_ignores_build_metadata():
+    version_key = check_upstream_versions.version_key
+    assert version_key("1.0.0+build.5") == version_key("1.0.0")
+    assert version_key("latest") is None
+
+
+def test_newest_version():
+    newest_version = check_upstream_versions.newest_version
+    assert newest_version(["OpenSSL_1_1_1", "OpenSSL_1_1_1a"]) == "OpenSSL_1_1_1a"
+    assert newest_version(["v1.10.0-rc1", "v1.9.0", "v1.10.0"]) == "v1.10.0"
+    # Without any version the forge order is kept
+    assert newest_version(["latest", "stable"]) == "latest"
+    assert newest_version([]) is None
+
+
+def test_select_latest_version_uses_all_pages():
+    # Tags sorted by name like the GitHub REST API does
+    tag_pages = [["v1.9.0", "v1.8.0"], ["v1.10.0", "svn100"], ["v1.1.0"]]
+    config = {"upstream-version-prefix": [{"name": "project", "prefix": "!svn"}]}
+
+    assert (
+        check_upstream_versions.select_latest_version(tag_pages, "project", config)
+        == "v1.10.0"
+    )
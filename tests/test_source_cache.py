@@ -0,0 +1,43 @@
+import threading
+import time
+from fedtools import cache, source_cache
+
+
+URL = "https://example.com/foo-1.0.tar.gz"
+
+
+def test_concurrent_downloads_of_the_same_url(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, "FEDTOOLS_CACHE_DIR", str(tmp_path))
+    downloads = []
+
+    def download_part(session, url, part_path, validator_path, progress):
+        downloads.append(url)
+        with open(validator_path, "w") as f:
+            f.write('"v1"')
+        with open(part_path, "wb") as f:
+            for _ in range(10):
+                f.write(b"foo")
+                # Give the other threads a chance to race on the partial file
+                time.sleep(0.01)
+
+    monkeypatch.setattr(source_cache, "download_part", download_part)
+    progress = source_cache.DownloadProgress(4, interactive=False)
+    paths = []
+    threads = [
+        threading.Thread(
+            target=lambda: paths.append(
+                source_cache.download_object(None, URL, progress)
+            )
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert downloads == [URL]
+    assert len(paths) == 4 and len(set(paths)) == 1
+    with open(paths[0], "rb") as f:
+        assert f.read() == b"foo" * 10
+    assert source_cache.cached_object(URL) == paths[0]
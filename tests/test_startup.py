@@ -0,0 +1,39 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+HEAVY_MODULES = ["copr", "rpm", "git", "requests", "tabulate"]
+# Only catches regressions like importing every subcommand at startup again,
+# the help output itself takes a fraction of this
+MAX_STARTUP_SECONDS = 2
+
+PRINT_HELP = f"""
+import json
+import sys
+from fedtools.fedtools import main
+
+sys.argv = ["fedtools", "--help"]
+try:
+    main()
+except SystemExit:
+    pass
+print(json.dumps([module for module in {HEAVY_MODULES!r} if module in sys.modules]))
+"""
+
+
+def test_help_does_not_import_subcommand_dependencies():
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", PRINT_HELP],
+        capture_output=True,
+        check=True,
+        env=os.environ | {"PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    duration = time.perf_counter() - start
+
+    assert b"usage: fedtools" in result.stdout
+    assert json.loads(result.stdout.splitlines()[-1]) == []
+    assert duration < MAX_STARTUP_SECONDS